@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+
+## Benchmark del emulador: corre workloads sinteticos fijos con cada scheduler
+## y mide ticks simulados, instrucciones e interrupciones por segundo y el pico de RSS.
+## Compara contra un baseline guardado para que las regresiones en Cpu.tick,
+## MMU.fetch o los handlers aparezcan como numeros.
+##
+##   python benchmark.py --save-baseline     (guarda benchmark_baseline.json)
+##   python benchmark.py                     (compara contra el baseline)
+
+import argparse
+import contextlib
+import functools
+import io
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+from tabulate import tabulate
+from hardware import *
+from so import *
+from sweep import SCHEDULERS, buildProgram
+import log
+
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+
+## workloads sinteticos fijos: lista de (prioridad, programa), todos arriban en el tick 0
+## en el programa un numero n es ASM.CPU(n) y 'IO' es ASM.IO()
+WORKLOADS = {
+    'cpu_bound': [(1 + index % 5, [400, 'IO', 500]) for index in range(16)],
+    'io_bound': [(1 + index % 5, [3, 'IO'] * 150) for index in range(16)],
+    'mixed': [(1, [50, 'IO'] * 12), (2, [5, 'IO'] * 100), (3, [900]), (4, [20, 'IO', 20] * 15)] * 3,
+}
+
+FRAME_SIZE = 4
+
+## metricas que se comparan contra el baseline: nombre -> 1 si mas es mejor, -1 si menos es mejor
+METRICS = {'ticksPerSecond': 1, 'instructionsPerSecond': 1, 'interruptsPerSecond': 1, 'peakRssKB': -1}
+
+
+## corre un caso repeat veces y se queda con la corrida mas rapida (la de menos ruido)
+def runCase(case, repeat = 3):
+    results = [runOnce(case) for _ in range(repeat)]
+    return min(results, key = lambda result: result['seconds'])
+
+
+## corre un caso en la maquina headless y devuelve sus metricas
+def runOnce(case):
+    workloadName, schedulerName, burstMode = case
+    workload = WORKLOADS[workloadName]
+    programs = [buildProgram(spec) for _, spec in workload]
+    ## memoria justa para todos los programas
+    frames = sum(program.pageCount(FRAME_SIZE) for program in programs)
+    with contextlib.redirect_stdout(io.StringIO()):
+        hardware = Hardware()
+        hardware.setup(frames * FRAME_SIZE, virtualTime = True, burstMode = burstMode)
+        kernel = Kernel(hardware, SCHEDULERS[schedulerName], FRAME_SIZE)
+        for index, (priority, _) in enumerate(workload):
+            path = 'c:/bench{index}.exe'.format(index = index)
+            kernel.fileSystem.write(path, programs[index])
+        start = time.perf_counter()
+        for index, (priority, _) in enumerate(workload):
+            kernel.run('c:/bench{index}.exe'.format(index = index), priority)
+        while kernel.pcbTable.terminatedCount() < len(workload):
+            hardware.step()
+        elapsed = time.perf_counter() - start
+    ticks = hardware.clock.currentTick + 1
+    instructions = sum(core.cpu.instructionsCount for core in hardware.cores)
+    interrupts = hardware.interruptVector.handledCount
+    return {
+        'case': caseName(case),
+        'ticks': ticks,
+        'seconds': elapsed,
+        'ticksPerSecond': ticks / elapsed,
+        'instructionsPerSecond': instructions / elapsed,
+        'interruptsPerSecond': interrupts / elapsed,
+        ## ru_maxrss esta en KB en Linux y en bytes en macOS
+        'peakRssKB': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // (1024 if sys.platform == 'darwin' else 1),
+    }
+
+
+def caseName(case):
+    workloadName, schedulerName, burstMode = case
+    return "{workload}/{scheduler}{burst}".format(workload = workloadName, scheduler = schedulerName, burst = '/burst' if burstMode else '')
+
+
+## cada caso corre en un proceso nuevo, asi el pico de RSS es solo el suyo
+def runBenchmarks(cases, repeat):
+    with multiprocessing.Pool(1, maxtasksperchild = 1) as pool:
+        return pool.map(functools.partial(runCase, repeat = repeat), cases, chunksize = 1)
+
+
+## compara contra el baseline, devuelve las filas de la tabla y si hubo regresiones
+def compare(results, baseline, tolerance):
+    rows = []
+    regression = False
+    for result in results:
+        row = [result['case'], result['ticks']]
+        base = baseline.get(result['case'])
+        for metric, direction in METRICS.items():
+            if base is None:
+                row.append("{value:.0f}".format(value = result[metric]))
+            else:
+                change = (result[metric] - base[metric]) / base[metric]
+                mark = ''
+                if change * direction < -tolerance:
+                    mark = ' REGRESSION'
+                    regression = True
+                row.append("{value:.0f} ({change:+.1%}){mark}".format(value = result[metric], change = change, mark = mark))
+        rows.append(row)
+    return rows, regression
+
+
+##
+##  MAIN
+##
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Benchmark del nucleo del emulador')
+    parser.add_argument('--schedulers', default = ','.join(SCHEDULERS))
+    parser.add_argument('--workloads', default = ','.join(WORKLOADS))
+    parser.add_argument('--burst', action = 'store_true', help = 'correr tambien con el EventClock en burst mode')
+    parser.add_argument('--baseline', default = BASELINE_FILE)
+    parser.add_argument('--save-baseline', action = 'store_true')
+    parser.add_argument('--repeat', type = int, default = 3, help = 'corridas por caso (se toma la mas rapida)')
+    parser.add_argument('--tolerance', type = float, default = 0.15, help = 'empeoramiento maximo aceptado (0.15 = 15%%)')
+    args = parser.parse_args()
+
+    log.setupLogger()
+    log.logger.setLevel(logging.WARNING)
+
+    cases = []
+    for workloadName in args.workloads.split(','):
+        for schedulerName in args.schedulers.split(','):
+            cases.append((workloadName, schedulerName, False))
+            if args.burst:
+                cases.append((workloadName, schedulerName, True))
+    results = runBenchmarks(cases, args.repeat)
+
+    baseline = dict()
+    if (not args.save_baseline) and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    rows, regression = compare(results, baseline, args.tolerance)
+    print(tabulate(rows, headers = ['case', 'ticks'] + list(METRICS), tablefmt = 'psql'))
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({result['case']: result for result in results}, f, indent = 2)
+        print("baseline guardado en {file}".format(file = args.baseline))
+    elif regression:
+        sys.exit(1)
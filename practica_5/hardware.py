@@ -1,8 +1,14 @@
 #!/usr/bin/env python
 
 from tabulate import tabulate
-from time import sleep
-from threading import Thread, Lock
+from time import sleep, perf_counter
+import asyncio
+import mmap
+import os
+from threading import Thread, Lock, Condition
+from collections import OrderedDict, defaultdict
+from itertools import repeat
+import random
 import log
 
 ##  Estas son la instrucciones soportadas por nuestro CPU
@@ -10,13 +16,57 @@ INSTRUCTION_IO = 'IO'
 INSTRUCTION_CPU = 'CPU'
 INSTRUCTION_EXIT = 'EXIT'
 
+##  Opcodes de las instrucciones codificadas (ver EncodedMemory)
+OPCODE_EMPTY = 0
+OPCODE_CPU = 1
+OPCODE_IO = 2
+OPCODE_EXIT = 3
+
+## instruction (or opcode) -> opcode
+OPCODES = {'': OPCODE_EMPTY, INSTRUCTION_CPU: OPCODE_CPU, INSTRUCTION_IO: OPCODE_IO, INSTRUCTION_EXIT: OPCODE_EXIT,
+           OPCODE_EMPTY: OPCODE_EMPTY, OPCODE_CPU: OPCODE_CPU, OPCODE_IO: OPCODE_IO, OPCODE_EXIT: OPCODE_EXIT}
+## opcode -> instruction
+INSTRUCTIONS = ['', INSTRUCTION_CPU, INSTRUCTION_IO, INSTRUCTION_EXIT]
+
+
+## a run of the same instruction repeated count times: it behaves like the list
+## of the repeated instruction but never materialises it (see Program)
+class InstructionRun():
+
+    __slots__ = ('instruction', 'count')
+
+    def __init__(self, instruction, count):
+        self.instruction = instruction
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return repeat(self.instruction, self.count)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.instruction] * len(range(*index.indices(self.count)))
+        if not -self.count <= index < self.count:
+            raise IndexError("InstructionRun index out of range")
+        return self.instruction
+
+    def __eq__(self, other):
+        if isinstance(other, InstructionRun):
+            return self.instruction == other.instruction and self.count == other.count
+        return list(self) == other
+
+    def __repr__(self):
+        return "InstructionRun({instruction}, {count})".format(instruction = self.instruction, count = self.count)
+
 
 ## Helper for emulated machine code
 class ASM():
 
     @classmethod
     def EXIT(self, times):
-        return [INSTRUCTION_EXIT] * times
+        return InstructionRun(INSTRUCTION_EXIT, times)
 
     @classmethod
     def IO(self):
@@ -24,7 +74,7 @@ class ASM():
 
     @classmethod
     def CPU(self, times):
-        return [INSTRUCTION_CPU] * times
+        return InstructionRun(INSTRUCTION_CPU, times)
 
     @classmethod
     def isEXIT(self, instruction):
@@ -42,13 +92,16 @@ IO_OUT_INTERRUPTION_TYPE = "#IO_OUT"
 NEW_INTERRUPTION_TYPE = "#NEW"
 TIMEOUT_INTERRUPTION_TYPE = "#TIMEOUT"
 STAT_INTERRUPTION_TYPE = "#STAT"
+PAGE_FAULT_INTERRUPTION_TYPE = "#PAGE_FAULT"
 
 ## emulates an Interrupt request
 class IRQ:
 
-    def __init__(self, type, parameters = None):
+    ## core: id of the core that raised the irq (0 for the devices and the kernel)
+    def __init__(self, type, parameters = None, core = 0):
         self._type = type
         self._parameters = parameters
+        self._core = core
 
     @property
     def parameters(self):
@@ -58,6 +111,10 @@ class IRQ:
     def type(self):
         return self._type
 
+    @property
+    def core(self):
+        return self._core
+
 
 ## emulates the Interrupt Vector Table
 class InterruptVector():
@@ -65,6 +122,8 @@ class InterruptVector():
     def __init__(self):
         self._handlers = dict()
         self.lock = Lock()
+        ## number of irqs handled (for benchmarks)
+        self._handledCount = 0
 
     def register(self, interruptionType, interruptionHandler):
         self._handlers[interruptionType] = interruptionHandler
@@ -72,30 +131,219 @@ class InterruptVector():
     def handle(self, irq):
         log.logger.info("Handling {type} irq with parameters = {parameters}".format(type=irq.type, parameters=irq.parameters ))
         self.lock.acquire()
+        ## the lock is released even if the handler fails, otherwise every later irq would block forever
+        try:
+            self._handledCount += 1
+            try:
+                irqHandler = self._handlers[irq.type]
+            except:
+               irqHandler = None
+               log.logger.info("No Handler found for irq type: {type}".format(type=irq.type ))
+
+            if not (irqHandler is None):
+                irqHandler.execute(irq)
+        finally:
+            self.lock.release()
+
+    @property
+    def handledCount(self):
+        return self._handledCount
+
+
+## an event registered in the TimingWheel: callback() runs at the beginning of tick
+class WheelEntry():
+
+    __slots__ = ('tick', 'seq', 'callback', 'cancelled', 'background')
+
+    def __init__(self, tick, seq, callback, background):
+        self.tick = tick
+        self.seq = seq
+        self.callback = callback
+        self.cancelled = False
+        ## background entries (ie: quantum expiries) are not pending work of the machine
+        self.background = background
+
+
+## hierarchical timing wheel: the "fire at tick T" events of the clock
+## (device completions, timer expiries, program arrivals, software timers).
+## Level L has 64 slots of 64**L ticks each. An entry lives in the lowest level
+## whose 64 slots cover both "now" and its tick, so level 0 holds the entries of the
+## current 64 ticks (one slot per tick); when "now" enters a new block the entries of
+## the matching slot of the upper level cascade down. The cost per tick does not
+## depend on how many entries are pending.
+class TimingWheel():
+
+    SLOT_BITS = 6
+    SLOTS = 1 << SLOT_BITS
+    LEVELS = 4
+
+    def __init__(self):
+        self._levels = [[[] for _ in range(self.SLOTS)] for _ in range(self.LEVELS)]
+        ## entries too far away for the upper level
+        self._overflow = []
+        ## last tick processed
+        self._now = -1
+        self._firing = False
+        self._seq = 0
+        self._pending = 0
+        self._pendingWork = 0
+
+    ## register callback to run at tickNbr (ticks already processed run at the next one)
+    def schedule(self, tickNbr, callback, background = False):
+        if self._firing:
+            tickNbr = max(tickNbr, self._now)
+        else:
+            tickNbr = max(tickNbr, self._now + 1)
+        entry = WheelEntry(tickNbr, self._seq, callback, background)
+        self._seq += 1
+        self._pending += 1
+        if not background:
+            self._pendingWork += 1
+        self._insert(entry)
+        return entry
+
+    def cancel(self, entry):
+        if not entry.cancelled:
+            entry.cancelled = True
+            self._pending -= 1
+            if not entry.background:
+                self._pendingWork -= 1
+
+    def _insert(self, entry):
+        for level in range(self.LEVELS):
+            shift = self.SLOT_BITS * (level + 1)
+            if (entry.tick >> shift) == (self._now >> shift):
+                slot = (entry.tick >> (self.SLOT_BITS * level)) & (self.SLOTS - 1)
+                self._levels[level][slot].append(entry)
+                return
+        self._overflow.append(entry)
+
+    ## move "now" to tickNbr (nothing can be due in between) cascading the upper levels
+    def _advanceTo(self, tickNbr):
+        previous = self._now
+        self._now = tickNbr
+        topShift = self.SLOT_BITS * self.LEVELS
+        if (tickNbr >> topShift) != (previous >> topShift):
+            overflow = self._overflow
+            self._overflow = []
+            for entry in overflow:
+                self._insert(entry)
+        for level in range(self.LEVELS - 1, 0, -1):
+            shift = self.SLOT_BITS * level
+            if (tickNbr >> shift) != (previous >> shift):
+                slot = (tickNbr >> shift) & (self.SLOTS - 1)
+                entries = self._levels[level][slot]
+                self._levels[level][slot] = []
+                for entry in entries:
+                    self._insert(entry)
+
+    ## run the callbacks due at tickNbr
+    def fire(self, tickNbr):
+        if tickNbr > self._now:
+            self._advanceTo(tickNbr)
+        slots = self._levels[0]
+        slot = tickNbr & (self.SLOTS - 1)
+        self._firing = True
+        ## callbacks may schedule new entries for this same tick
+        ## (if one fails the wheel stops firing, so later entries are not left in the fired slot)
         try:
-            irqHandler = self._handlers[irq.type]
-        except:
-           irqHandler = None
-           log.logger.info("No Handler found for irq type: {type}".format(type=irq.type ))
+            while slots[slot]:
+                entries = sorted(slots[slot], key = lambda entry: entry.seq)
+                slots[slot] = []
+                for entry in entries:
+                    if not entry.cancelled:
+                        self.cancel(entry)
+                        entry.callback()
+        finally:
+            self._firing = False
+
+    ## tick of the next pending entry (None if there is nothing pending)
+    ## the entries of each level are later than the ones of the lower levels,
+    ## and inside a level the slots after the one of "now" are in tick order
+    def nextExpiry(self):
+        if self._pending == 0:
+            return None
+        for level in range(self.LEVELS):
+            shift = self.SLOT_BITS * level
+            first = ((self._now >> shift) & (self.SLOTS - 1)) + 1
+            for slot in range(first, self.SLOTS):
+                ticks = [entry.tick for entry in self._levels[level][slot] if not entry.cancelled]
+                if ticks:
+                    return min(ticks)
+        ticks = [entry.tick for entry in self._overflow if not entry.cancelled]
+        if ticks:
+            return min(ticks)
+        return None
 
-        if not (irqHandler is None):
-            irqHandler.execute(irq)
-        self.lock.release()
+    @property
+    def pending(self):
+        return self._pending
 
+    ## pending entries, without the background ones
+    @property
+    def pendingWork(self):
+        return self._pendingWork
+
+
+## what the clock does when the kernel reports that there is nothing left to do
+IDLE_TICK = 'tick'    # keep ticking (NOOPs)
+IDLE_HALT = 'halt'    # stop the clock and log a run summary
+IDLE_WAIT = 'wait'    # tickless idle: sleep until the next submission arrives
 
 ## emulates the Internal Clock
 class Clock():
 
-    def __init__(self):
+    ## tickPeriod: seconds per tick in real time mode (can be less than a millisecond)
+    ## idlePolicy: IDLE_TICK, IDLE_HALT or IDLE_WAIT
+    def __init__(self, virtualTime = False, tickPeriod = 1, idlePolicy = IDLE_WAIT):
         self._subscribers = []
         self._running = False
         self._currentTick = 0
+        self._nextTick = 0
+        ## events scheduled for a given tick (device completions, timer expiries, arrivals)
+        self._wheel = TimingWheel()
+        ## in virtual time mode the clock does not wait between ticks:
+        ## currentTick is the only notion of time
+        self._virtualTime = virtualTime
+        self._tickPeriod = tickPeriod
+        ## wall time at which the next tick must start (real time mode)
+        self._deadline = None
+        ## ticks that took longer than the period, and the worst delay (in seconds)
+        self._overruns = 0
+        self._worstOverrun = 0
+        ## set by the kernel when it has no process left (see setIdle)
+        self._idle = False
+        self._idlePolicy = idlePolicy
+        self._idleCondition = Condition()
+        ## called when the clock halts (ie: to log a run summary)
+        self._onHalt = None
 
     def addSubscriber(self, subscriber):
         self._subscribers.append(subscriber)
 
+    ## schedule a callback (ie: a program arrival, a device completion, a software timer)
+    ## to run at the beginning of tick tickNbr. Returns the entry, to cancel it
+    ## background=True: the entry alone does not keep the machine busy (see Hardware.isIdle)
+    def schedule(self, tickNbr, callback, background = False):
+        return self._wheel.schedule(tickNbr, callback, background)
+
+    def cancel(self, entry):
+        self._wheel.cancel(entry)
+
     def stop(self):
         self._running = False
+        with self._idleCondition:
+            self._idleCondition.notify_all()
+
+    ## the kernel reports if it has work to do (False wakes up a sleeping clock)
+    def setIdle(self, idle):
+        with self._idleCondition:
+            self._idle = idle
+            self._idleCondition.notify_all()
+
+    ## idle: the kernel has nothing to do and there is no arrival scheduled
+    def isIdle(self):
+        return self._idle and self._wheel.pendingWork == 0
 
     def start(self):
         if not self._running:
@@ -105,29 +353,176 @@ class Clock():
             t.start()
 
     def __start(self):
-        tickNbr = 0
+        self._deadline = None
         while (self._running):
-            self.tick(tickNbr)
-            tickNbr += 1
+            if self.isIdle() and self._idlePolicy == IDLE_HALT:
+                self._halt()
+            elif self.isIdle() and self._idlePolicy == IDLE_WAIT:
+                self._sleepWhileIdle()
+            else:
+                self.step()
+                self._wait()
+
+    def _halt(self):
+        self._running = False
+        log.logger.info("---- :::: HALT CLOCK at tick {tickNbr}: nothing left to do ::: -----".format(tickNbr = self._currentTick))
+        if self._onHalt:
+            self._onHalt()
+
+    ## tickless idle: no ticks (and no #STAT or NOOPs) until the kernel gets work again
+    def _sleepWhileIdle(self):
+        log.logger.info("---- :::: CLOCK IDLE at tick {tickNbr}: waiting for work ::: -----".format(tickNbr = self._currentTick))
+        with self._idleCondition:
+            while self._running and self.isIdle():
+                self._idleCondition.wait()
+        ## the time slept does not count as overrun
+        self._deadline = None
+
+    ## wait until the deadline of the next tick (only in real time mode).
+    ## The deadlines are fixed (start + n * tickPeriod), so the time the tick itself
+    ## takes does not pile up as drift
+    def _wait(self):
+        delay = self._nextDelay()
+        if delay > 0:
+            ## sleep() is not precise below the millisecond: sleep the most of it and spin the rest
+            if delay > 0.002:
+                sleep(delay - 0.001)
+            while perf_counter() < self._deadline:
+                pass
+
+    ## seconds to wait for the next deadline (0 in virtual time mode or if the tick overran)
+    def _nextDelay(self):
+        if self._virtualTime:
+            return 0
+        now = perf_counter()
+        if self._deadline is None:
+            self._deadline = now
+        self._deadline += self._tickPeriod
+        delay = self._deadline - now
+        if delay < 0:
+            self._overruns += 1
+            self._worstOverrun = max(self._worstOverrun, -delay)
+            log.logger.warning("clock - overrun: tick {tickNbr} took {late:.6f}s more than its period".format(tickNbr = self._currentTick, late = -delay))
+            if -delay > self._tickPeriod:
+                ## too late to catch up: start counting again from now
+                self._deadline = now
+            return 0
+        return delay
+
+    ## asyncio version of the clock loop: runs ticks until condition() is true,
+    ## yielding to the event loop between ticks (instead of running in its own thread)
+    async def run_until(self, condition):
+        self._deadline = None
+        while not condition():
+            self.step()
+            await asyncio.sleep(self._nextDelay())
+
+    ## run the next clock cycle
+    def step(self):
+        self.tick(self._nextTick)
 
     def tick(self, tickNbr):
         self._currentTick = tickNbr
+        self._nextTick = tickNbr + 1
         log.logger.info("        --------------- tick: {tickNbr} ---------------".format(tickNbr = tickNbr))
+        ## run the events scheduled for this tick
+        self._wheel.fire(tickNbr)
         ## notify all subscriber that a new clock cycle has started
         for subscriber in self._subscribers:
             subscriber.tick(tickNbr)
-        ## wait 1 second and keep looping
-        sleep(1)
 
     def do_ticks(self, times):
         log.logger.info("---- :::: CLOCK do_ticks: {times} ::: -----".format(times=times))
-        for tickNbr in range(0, times):
-            self.tick(tickNbr)
+        self._deadline = None
+        for _ in range(0, times):
+            self.step()
+            self._wait()
 
     @property
     def currentTick(self):
         return self._currentTick
 
+    @property
+    def nextTick(self):
+        return self._nextTick
+
+    @property
+    def virtualTime(self):
+        return self._virtualTime
+
+    @property
+    def tickPeriod(self):
+        return self._tickPeriod
+
+    @property
+    def idlePolicy(self):
+        return self._idlePolicy
+
+    @property
+    def onHalt(self):
+        return self._onHalt
+
+    @onHalt.setter
+    def onHalt(self, onHalt):
+        self._onHalt = onHalt
+
+    @property
+    def overruns(self):
+        return self._overruns
+
+    @property
+    def worstOverrun(self):
+        return self._worstOverrun
+
+    ## pending scheduled events that are real work (arrivals, device completions)
+    @property
+    def pendingWork(self):
+        return self._wheel.pendingWork
+
+
+## emulates the Internal Clock as a discrete event engine:
+## instead of calling every subscriber on every tick, it jumps straight to the next
+## meaningful tick: the next entry of the timing wheel (a device completion, a timer
+## expiry, a scheduled arrival) or the next tick a subscriber needs.
+## Subscribers may implement:
+##   ticksToNextEvent(limit) -> ticks that can be skipped safely, no need to look past limit
+##                              (0 = must tick now, None = nothing pending)
+##   advance(ticks)     -> account for the skipped ticks
+class EventClock(Clock):
+
+    def __init__(self, idlePolicy = IDLE_WAIT):
+        super(EventClock, self).__init__(virtualTime = True, idlePolicy = idlePolicy)
+
+    def step(self):
+        ticks = self.ticksToNextEvent()
+        if ticks:
+            self.advance(ticks)
+        self.tick(self._nextTick)
+
+    ## ticks that can be skipped before the next meaningful tick (None = nothing pending)
+    ## each subscriber gets the bound found so far, so it never has to look further than that
+    def ticksToNextEvent(self):
+        nextEvent = None
+        nextExpiry = self._wheel.nextExpiry()
+        if nextExpiry is not None:
+            nextEvent = max(0, nextExpiry - self._nextTick)
+        for subscriber in self._subscribers:
+            ticksToNextEvent = getattr(subscriber, "ticksToNextEvent", None)
+            ticks = ticksToNextEvent(nextEvent) if ticksToNextEvent else 0
+            if ticks is not None and (nextEvent is None or ticks < nextEvent):
+                nextEvent = ticks
+        return nextEvent
+
+    ## skip the next ticks without calling tick() on the subscribers
+    def advance(self, ticks):
+        log.logger.info("        --------------- skip ticks: {first} to {last} ---------------".format(first = self._nextTick, last = self._nextTick + ticks - 1))
+        for subscriber in self._subscribers:
+            advance = getattr(subscriber, "advance", None)
+            if advance:
+                advance(ticks)
+        self._nextTick += ticks
+        self._currentTick = self._nextTick - 1
+
 ## emulates the main memory (RAM)
 class Memory():
 
@@ -141,22 +536,439 @@ class Memory():
     def read(self, addr):
         return self._cells[addr]
 
+    ## writes the values in the cells starting at addr (in one slice assignment)
+    def write_block(self, addr, values):
+        self._checkBlock(addr, len(values))
+        self._cells[addr:addr + len(values)] = values
+
+    ## the values of the count cells starting at addr
+    def read_block(self, addr, count):
+        self._checkBlock(addr, count)
+        return self._cells[addr:addr + count]
+
+    ## writes value in the count cells starting at addr
+    def fill(self, addr, value, count):
+        self._checkBlock(addr, count)
+        self._cells[addr:addr + count] = [value] * count
+
+    ## writes the runs (value, count) one after the other starting at addr,
+    ## each run is only expanded in the cells it fills
+    def write_runs(self, addr, runs):
+        self._checkBlock(addr, sum(count for _, count in runs))
+        for value, count in runs:
+            self.fill(addr, value, count)
+            addr += count
+
+    ## a slice would silently grow (or cut) the cells, so the block must fit in the memory
+    def _checkBlock(self, addr, count):
+        if addr < 0 or addr + count > self._size:
+            raise IndexError("Invalid Block, {addr}..{end} is out of memory size: {size}".format(addr = addr, end = addr + count - 1, size = self._size))
+
     @property
     def size(self):
         return self._size
 
+    ## the MMU tells the memory its frame size (the cells of this memory are not grouped in frames)
+    def setFrameSize(self, frameSize):
+        pass
+
     def __repr__(self):
         return tabulate(enumerate(self._cells), tablefmt='psql')
         ##return "Memoria = {mem}".format(mem=self._cells)
 
+
+## emulates the main memory storing one byte per cell: the opcode of the instruction
+## (write accepts instructions or opcodes, read returns opcodes)
+class EncodedMemory(Memory):
+
+    def __init__(self, size):
+        self._size = size
+        self._cells = bytearray(size)
+
+    def write(self, addr, value):
+        self._cells[addr] = OPCODES[value]
+
+    def read(self, addr):
+        return self._cells[addr]
+
+    def write_block(self, addr, values):
+        self._checkBlock(addr, len(values))
+        self._cells[addr:addr + len(values)] = bytes(map(OPCODES.__getitem__, values))
+
+    def fill(self, addr, value, count):
+        self._checkBlock(addr, count)
+        self._cells[addr:addr + count] = bytes((OPCODES[value],)) * count
+
+    def __repr__(self):
+        return tabulate(enumerate(INSTRUCTIONS[self._cells[addr]] for addr in range(self._size)), tablefmt='psql')
+
+
+## emulates the main memory as an encoded memory that lives in an mmap:
+## anonymous (imagePath None) or backed by a file, the memory image, that keeps
+## its content across runs. The OS only commits the pages that are touched,
+## so the simulated memory can be much larger than what is actually used
+class MmapMemory(EncodedMemory):
+
+    def __init__(self, size, imagePath = None):
+        self._size = size
+        self._imagePath = imagePath
+        self._file = None
+        if imagePath is None:
+            self._cells = mmap.mmap(-1, size)
+        else:
+            ## an existing image is reused as it is (growing it with empty cells if needed)
+            self._file = open(imagePath, 'a+b')
+            if os.path.getsize(imagePath) < size:
+                self._file.truncate(size)
+            self._cells = mmap.mmap(self._file.fileno(), size)
+
+    @property
+    def imagePath(self):
+        return self._imagePath
+
+    ## writes the changes to the memory image
+    def flush(self):
+        self._cells.flush()
+
+    def close(self):
+        self._cells.close()
+        if self._file is not None:
+            self._file.close()
+
+
+## emulates the main memory keeping only the frames that were written:
+## {frameId: cells of the frame}, with frames of MMU.frameSize cells.
+## Reading a cell of a frame never written returns the empty value
+class SparseMemory(Memory):
+
+    def __init__(self, size, frameSize = 4):
+        self._size = size
+        self._frameSize = frameSize
+        self._frames = dict()
+
+    def setFrameSize(self, frameSize):
+        if self._frames and frameSize != self._frameSize:
+            raise Exception("Can't change the frame size of a sparse memory that is in use")
+        self._frameSize = frameSize
+
+    def write(self, addr, value):
+        if addr >= self._size:
+            raise IndexError("Invalid Address, {addr} is higher than memory size: {size}".format(addr = addr, size = self._size))
+        frame = self._frames.get(addr // self._frameSize)
+        if frame is None:
+            frame = [''] * self._frameSize
+            self._frames[addr // self._frameSize] = frame
+        frame[addr % self._frameSize] = value
+
+    def read(self, addr):
+        if addr >= self._size:
+            raise IndexError("Invalid Address, {addr} is higher than memory size: {size}".format(addr = addr, size = self._size))
+        frame = self._frames.get(addr // self._frameSize)
+        if frame is None:
+            return ''
+        return frame[addr % self._frameSize]
+
+    ## one slice per frame spanned by the block
+    def write_block(self, addr, values):
+        self._checkBlock(addr, len(values))
+        done = 0
+        while done < len(values):
+            frameId, offset = divmod(addr + done, self._frameSize)
+            chunk = min(self._frameSize - offset, len(values) - done)
+            frame = self._frames.get(frameId)
+            if frame is None:
+                frame = [''] * self._frameSize
+                self._frames[frameId] = frame
+            frame[offset:offset + chunk] = values[done:done + chunk]
+            done += chunk
+
+    ## one slice per frame spanned by the filled cells
+    def fill(self, addr, value, count):
+        self._checkBlock(addr, count)
+        done = 0
+        while done < count:
+            frameId, offset = divmod(addr + done, self._frameSize)
+            chunk = min(self._frameSize - offset, count - done)
+            frame = self._frames.get(frameId)
+            if frame is None:
+                frame = [''] * self._frameSize
+                self._frames[frameId] = frame
+            frame[offset:offset + chunk] = [value] * chunk
+            done += chunk
+
+    def read_block(self, addr, count):
+        self._checkBlock(addr, count)
+        values = []
+        done = 0
+        while done < count:
+            frameId, offset = divmod(addr + done, self._frameSize)
+            chunk = min(self._frameSize - offset, count - done)
+            frame = self._frames.get(frameId)
+            if frame is None:
+                values.extend([''] * chunk)
+            else:
+                values.extend(frame[offset:offset + chunk])
+            done += chunk
+        return values
+
+    ## number of frames actually stored
+    @property
+    def populatedFrames(self):
+        return len(self._frames)
+
+    ## only the populated frames
+    def __repr__(self):
+        rows = []
+        for frameId in sorted(self._frames):
+            for offset, value in enumerate(self._frames[frameId]):
+                rows.append((frameId * self._frameSize + offset, value))
+        return tabulate(rows, tablefmt='psql')
+
+
+## memory types that can be selected in Hardware.setup
+MEMORY_TYPES = {'list': Memory, 'encoded': EncodedMemory, 'mmap': MmapMemory, 'sparse': SparseMemory}
+
+## TLB replacement policies
+TLB_LRU = 'lru'
+TLB_RANDOM = 'random'
+TLB_CLOCK = 'clock'
+
+
+## emulates a Translation Lookaside Buffer: a small cache (asid, pageId) -> frameId
+## in front of the page tables, with a fixed number of entries. The entries are tagged
+## with the address space id (ASID), so the ones of several processes coexist
+class TLB():
+
+    def __init__(self, size, policy = TLB_LRU):
+        if policy not in (TLB_LRU, TLB_RANDOM, TLB_CLOCK):
+            raise ValueError("Unknown TLB policy: {policy}".format(policy = policy))
+        self._size = size
+        self._policy = policy
+        ## (asid, pageId) -> frameId, kept in LRU order (the oldest first)
+        self._entries = OrderedDict()
+        ## clock policy: the ring of cached keys, their reference bits and the hand
+        self._ring = []
+        self._referenced = dict()
+        self._hand = 0
+        ## random policy: own generator, so the runs are reproducible
+        self._random = random.Random(0)
+        self._hits = 0
+        self._misses = 0
+        self._flushes = 0
+        self._evictions = 0
+
+    ## the cached frame of the (asid, pageId) key or None (a miss)
+    def lookup(self, key):
+        frameId = self._entries.get(key)
+        if frameId is None:
+            self._misses += 1
+            return None
+        self._hits += 1
+        if self._policy == TLB_LRU:
+            self._entries.move_to_end(key)
+        elif self._policy == TLB_CLOCK:
+            self._referenced[key] = True
+        return frameId
+
+    ## whether the key is cached (without touching the counters nor the replacement state)
+    def contains(self, key):
+        return key in self._entries
+
+    ## account for hits on a cached key (burst mode skips those lookups)
+    def addHits(self, key, hits):
+        self._hits += hits
+        if self._policy == TLB_LRU:
+            self._entries.move_to_end(key)
+        elif self._policy == TLB_CLOCK:
+            self._referenced[key] = True
+
+    def insert(self, key, frameId):
+        if key in self._entries:
+            self._entries[key] = frameId
+            return
+        if len(self._entries) >= self._size:
+            self._evict(key)
+        elif self._policy == TLB_CLOCK:
+            self._ring.append(key)
+        self._entries[key] = frameId
+        ## only the clock policy keeps reference bits (and removes them with the entry)
+        if self._policy == TLB_CLOCK:
+            self._referenced[key] = True
+
+    def _evict(self, key):
+        self._evictions += 1
+        if self._policy == TLB_LRU:
+            self._entries.popitem(last = False)
+        elif self._policy == TLB_RANDOM:
+            del self._entries[self._random.choice(list(self._entries))]
+        else:
+            ## second chance: skip (and clear) the referenced entries
+            while self._referenced[self._ring[self._hand]]:
+                self._referenced[self._ring[self._hand]] = False
+                self._hand = (self._hand + 1) % self._size
+            victim = self._ring[self._hand]
+            del self._entries[victim]
+            del self._referenced[victim]
+            self._ring[self._hand] = key
+            self._hand = (self._hand + 1) % self._size
+
+    def invalidate(self, key):
+        if key in self._entries:
+            del self._entries[key]
+            if self._policy == TLB_CLOCK:
+                self._ring.remove(key)
+                del self._referenced[key]
+                self._hand = self._hand % len(self._ring) if self._ring else 0
+
+    ## drop the entries of one address space (its process finished)
+    def flushAddressSpace(self, asid):
+        for key in [key for key in self._entries if key[0] == asid]:
+            self.invalidate(key)
+
+    def flush(self):
+        self._entries.clear()
+        self._ring = []
+        self._referenced = dict()
+        self._hand = 0
+        self._flushes += 1
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def policy(self):
+        return self._policy
+
+    @property
+    def hits(self):
+        return self._hits
+
+    @property
+    def misses(self):
+        return self._misses
+
+    @property
+    def flushes(self):
+        return self._flushes
+
+    @property
+    def evictions(self):
+        return self._evictions
+
+    def __repr__(self):
+        return "TLB({policy}, {used}/{size}, hits={hits}, misses={misses}, flushes={flushes})".format(
+            policy = self._policy, used = len(self._entries), size = self._size,
+            hits = self._hits, misses = self._misses, flushes = self._flushes)
+
+
+## raised by the MMU when the page of the address is not mapped
+## (a light object: the message is only built if someone prints it)
+class PageFault(Exception):
+    __slots__ = ('asid', 'pageId')
+
+    def __init__(self, asid, pageId):
+        self.asid = asid
+        self.pageId = pageId
+
+    def __str__(self):
+        return "Error en el MMU: No se cargo la pagina {pageId} (ASID {asid})".format(pageId = self.pageId, asid = self.asid)
+
+
+## raised by the MMU when the address is beyond the process limit
+class AddressFault(Exception):
+    __slots__ = ('logicalAddress', 'limit')
+
+    def __init__(self, logicalAddress, limit):
+        self.logicalAddress = logicalAddress
+        self.limit = limit
+
+    def __str__(self):
+        return "Invalid Address, {logicalAddress} is higher than process limit: {limit}".format(logicalAddress = self.logicalAddress, limit = self.limit)
+
+
+## reference and dirty bits of each frame, shared by the MMUs of all the cores
+## (the kernel boots them when it needs them, see MMU.references)
+## referenced[frameId] is the "time" of the last access (a global access counter, 0 = not referenced)
+## so page replacement policies can use it as a reference bit or as an LRU timestamp
+## Only the frames in use are stored (a frame never touched reads as 0 / not dirty),
+## so a huge memory does not pay for the frames it never uses
+class PageReferences():
+
+    ## record=True also keeps the reference string: the (asid, pageId) accessed, in order
+    ## (consecutive accesses to the same page are recorded once)
+    def __init__(self, frames, record = False):
+        self._frames = frames
+        self._referenced = defaultdict(int)
+        self._dirty = defaultdict(bool)
+        self._accesses = 0
+        self._trace = [] if record else None
+
+    def touch(self, frameId, asid, pageId, count = 1):
+        self._accesses += count
+        self._referenced[frameId] = self._accesses
+        if self._trace is not None:
+            page = (asid, pageId)
+            if not self._trace or self._trace[-1] != page:
+                self._trace.append(page)
+
+    def markDirty(self, frameId):
+        self._dirty[frameId] = True
+
+    ## the frame lost its page
+    def clear(self, frameId):
+        self._referenced.pop(frameId, None)
+        self._dirty.pop(frameId, None)
+
+    ## a page was just loaded in the frame: it counts as used now (and clean),
+    ## so it is not the next victim before it runs (not recorded in the trace)
+    def load(self, frameId):
+        self._referenced[frameId] = max(self._accesses, 1)
+        self._dirty[frameId] = False
+
+    @property
+    def referenced(self):
+        return self._referenced
+
+    @property
+    def dirty(self):
+        return self._dirty
+
+    @property
+    def accesses(self):
+        return self._accesses
+
+    @property
+    def trace(self):
+        return self._trace
+
+
 ## emulates the Memory Management Unit (MMU)
+## tlbSize=None translates straight from the page table (no TLB, no misses)
+## tlbMissPenalty: extra cycles the Cpu stalls on each TLB miss
+## The MMU keeps the page table of each address space (ASID) loaded on it,
+## a context switch only changes the current ASID. A page table is a list
+## pageId -> frameId (None = not mapped) that is installed by reference
 class MMU():
 
-    def __init__(self, memory):
+    def __init__(self, memory, tlbSize = None, tlbPolicy = TLB_LRU, tlbMissPenalty = 0):
         self._memory = memory
         self._frameSize = 0
+        ## with a power of two frameSize: pageId = address >> shift, offset = address & mask
+        self._shift = None
+        self._mask = None
         self._limit = 999
-        self._tlb = dict()
+        ## asid -> page table
+        self._pageTables = dict()
+        self._asid = None
+        ## page table of the current address space
+        self._pageTable = []
+        self._tlb = None if tlbSize is None else TLB(tlbSize, tlbPolicy)
+        self._tlbMissPenalty = tlbMissPenalty
+        ## penalty cycles of the last fetch, the Cpu takes them with takeStallCycles()
+        self._stallCycles = 0
+        ## reference and dirty bits of the frames (None = not tracked)
+        self._references = None
 
     @property
     def limit(self):
@@ -173,106 +985,327 @@ class MMU():
     @frameSize.setter
     def frameSize(self, frameSize):
         self._frameSize = frameSize
+        if frameSize > 0 and (frameSize & (frameSize - 1)) == 0:
+            self._shift = frameSize.bit_length() - 1
+            self._mask = frameSize - 1
+        else:
+            self._shift = None
+            self._mask = None
+        self._memory.setFrameSize(frameSize)
 
-    def resetTLB(self):
-        self._tlb = dict()
+    @property
+    def tlb(self):
+        return self._tlb
 
-    def setPageFrame(self, pageId, frameId):
-        self._tlb[pageId] = frameId
+    @property
+    def tlbMissPenalty(self):
+        return self._tlbMissPenalty
 
-    def fetch(self,  logicalAddress):
-        if (logicalAddress > self._limit):
-            raise Exception("Invalid Address,  {logicalAddress} is higher than process limit: {limit}".format(limit = self._limit, logicalAddress = logicalAddress))
-        #
-        # calculamos la pagina y el offset correspondiente a la direccion logica recibida 
+    @property
+    def references(self):
+        return self._references
+
+    @references.setter
+    def references(self, references):
+        self._references = references
+
+    @property
+    def asid(self):
+        return self._asid
+
+    ## forget every address space and flush the whole TLB
+    def resetTLB(self):
+        self._pageTables = dict()
+        self._pageTable = []
+        self._asid = None
+        if self._tlb is not None:
+            self._tlb.flush()
+
+    def hasAddressSpace(self, asid):
+        return asid in self._pageTables
+
+    ## context switch: the TLB entries of the other address spaces stay valid
+    ## pageTable (optional) is installed as is, later changes to it must go through setPageFrame()
+    def switchAddressSpace(self, asid, pageTable = None):
+        if pageTable is not None and self._pageTables.get(asid) is not pageTable:
+            if self._tlb is not None and asid in self._pageTables:
+                self._tlb.flushAddressSpace(asid)
+            self._pageTables[asid] = pageTable
+        self._asid = asid
+        self._pageTable = self._pageTables.setdefault(asid, [])
+
+    ## the address space is gone: drop its page table and its TLB entries
+    def releaseAddressSpace(self, asid):
+        self._pageTables.pop(asid, None)
+        if self._tlb is not None:
+            self._tlb.flushAddressSpace(asid)
+        if self._asid == asid:
+            self._asid = None
+            self._pageTable = []
+
+    ## map a page of the current address space (frameId None unmaps it)
+    def setPageFrame(self, pageId, frameId):
+        if pageId >= len(self._pageTable):
+            self._pageTable.extend([None] * (pageId + 1 - len(self._pageTable)))
+        self._pageTable[pageId] = frameId
+        if self._tlb is not None:
+            self._tlb.invalidate((self._asid, pageId))
+
+    def takeStallCycles(self):
+        cycles = self._stallCycles
+        self._stallCycles = 0
+        return cycles
+
+    ## with a TLB or with the page references tracked, burst mode can only skip the
+    ## fetches inside one page: the number of addresses from there to the end of the page
+    ## (0 if the page is not in the TLB), None when there is nothing to track
+    def cachedRun(self, logicalAddress):
+        if self._tlb is None and self._references is None:
+            return None
+        pageId, offset = divmod(logicalAddress, self._frameSize)
+        if self._tlb is not None and not self._tlb.contains((self._asid, pageId)):
+            return 0
+        return self._frameSize - offset
+
+    ## burst mode retired the run of the cached page of the address without fetching it
+    def addBurstHits(self, logicalAddress, hits):
         pageId = logicalAddress // self._frameSize
-        offset = logicalAddress % self._frameSize
+        if self._tlb is not None:
+            self._tlb.addHits((self._asid, pageId), hits)
+        if self._references is not None:
+            self._references.touch(self._pageTable[pageId], self._asid, pageId, hits)
+
+    ## the page was evicted: drop its TLB entry
+    def invalidatePage(self, asid, pageId):
+        if self._tlb is not None:
+            self._tlb.invalidate((asid, pageId))
+
+    ## frame of the page, straight from the page table
+    def _frame(self, pageId):
+        pageTable = self._pageTable
+        frameId = pageTable[pageId] if pageId < len(pageTable) else None
+        if frameId is None:
+            raise PageFault(self._asid, pageId)
+        return frameId
+
+    ## frame of the page, through the TLB
+    def _cachedFrame(self, pageId):
+        key = (self._asid, pageId)
+        frameId = self._tlb.lookup(key)
+        if frameId is None:
+            frameId = self._frame(pageId)
+            self._tlb.insert(key, frameId)
+            self._stallCycles += self._tlbMissPenalty
+        return frameId
+
+    ## fast path: everything inline, only the faults leave it
+    def fetch(self, logicalAddress):
+        if logicalAddress > self._limit:
+            raise AddressFault(logicalAddress, self._limit)
         #
-        # buscamos la direccion Base del frame donde esta almacenada la pagina
-        try:
-            frameId = self._tlb[pageId]
-        except:
-            raise Exception("\n*\n* ERROR \n*\n Error en el MMU\nNo se cargo la pagina  {pageId}".format(pageId = str(pageId)))
+        # calculamos la pagina y el offset correspondiente a la direccion logica recibida
+        shift = self._shift
+        if shift is not None:
+            pageId = logicalAddress >> shift
+            offset = logicalAddress & self._mask
+        else:
+            pageId, offset = divmod(logicalAddress, self._frameSize)
         #
-        ##calculamos la direccion fisica resultante
-        frameBaseDir  = self._frameSize * frameId
-        physicalAddress = frameBaseDir + offset
+        # buscamos el frame donde esta almacenada la pagina
+        if self._tlb is None:
+            try:
+                frameId = self._pageTable[pageId]
+            except IndexError:
+                frameId = None
+            if frameId is None:
+                raise PageFault(self._asid, pageId)
+        else:
+            frameId = self._cachedFrame(pageId)
+        if self._references is not None:
+            self._references.touch(frameId, self._asid, pageId)
         #
-        # obtenemos la instrucción alocada en esa direccion
-        return self._memory.read(physicalAddress)
+        # obtenemos la instrucción alocada en la direccion fisica resultante
+        if shift is not None:
+            return self._memory.read((frameId << shift) | offset)
+        return self._memory.read(frameId * self._frameSize + offset)
+
+    ## read without going through the TLB (no counters, no penalty)
+    def peek(self, logicalAddress):
+        if logicalAddress > self._limit:
+            raise AddressFault(logicalAddress, self._limit)
+        pageId, offset = divmod(logicalAddress, self._frameSize)
+        return self._memory.read(self._frame(pageId) * self._frameSize + offset)
+
+    ## write through the page table, the page becomes dirty
+    ## (the Cpu only fetches, this is for the kernel or the devices)
+    def store(self, logicalAddress, value):
+        if logicalAddress > self._limit:
+            raise AddressFault(logicalAddress, self._limit)
+        pageId, offset = divmod(logicalAddress, self._frameSize)
+        frameId = self._frame(pageId) if self._tlb is None else self._cachedFrame(pageId)
+        if self._references is not None:
+            self._references.touch(frameId, self._asid, pageId)
+            self._references.markDirty(frameId)
+        self._memory.write(frameId * self._frameSize + offset, value)
 
 
 ## emulates the main Central Processor Unit
 class Cpu():
 
-    def __init__(self, mmu, interruptVector):
+    def __init__(self, mmu, interruptVector, coreId = 0):
         self._mmu = mmu
         self._interruptVector = interruptVector
+        self._coreId = coreId
         self._pc = -1
         self._ir = None
+        self._opcode = OPCODE_EMPTY
         self._enable_stats = False
+        ## in burst mode a whole run of CPU instructions is retired in one step (see EventClock)
+        self._burstMode = False
+        ## number of instructions executed (for benchmarks)
+        self._instructionsCount = 0
+        ## cycles left waiting on a TLB miss before the fetched instruction executes
+        self._stallCycles = 0
 
 
     def tick(self, tickNbr):
         self._stats()
         if (self.isBusy()):
-            self._fetch()
+            if self._stallCycles > 0:
+                self._stallCycles -= 1
+                if self._stallCycles > 0:
+                    log.logger.info("cpu - Stall (TLB miss), PC={pc}".format(pc=self._pc))
+                    return
+            else:
+                try:
+                    self._fetch()
+                except PageFault as fault:
+                    ## the page is not in memory: the PC is not advanced, the instruction
+                    ## is fetched again once the kernel loads the page (this tick is lost)
+                    log.logger.info("cpu - Page fault: page {pageId}, PC={pc}".format(pageId=fault.pageId, pc=self._pc))
+                    pageFaultIRQ = IRQ(PAGE_FAULT_INTERRUPTION_TYPE, fault.pageId, self._coreId)
+                    self._interruptVector.handle(pageFaultIRQ)
+                    return
+                self._stallCycles = self._mmu.takeStallCycles()
+                if self._stallCycles > 0:
+                    log.logger.info("cpu - Stall (TLB miss), PC={pc}".format(pc=self._pc))
+                    return
             self._decode()
             self._execute()
         else:
             log.logger.info("cpu - NOOP")
 
+    ## account for ticks skipped by the EventClock: while idle they are NOOPs,
+    ## while busy (burst mode) each one retires a plain CPU instruction
+    def advance(self, ticks):
+        self._stats(ticks)
+        if (self.isBusy()):
+            self._mmu.addBurstHits(self._pc, ticks)
+            self._pc += ticks
+            self._instructionsCount += ticks
+            log.logger.info("cpu - Burst: {ticks} x {instr}, PC={pc}".format(ticks=ticks, instr=INSTRUCTION_CPU, pc=self._pc))
+        else:
+            log.logger.info("cpu - NOOP x {ticks}".format(ticks=ticks))
+
+    ## length of the run of plain CPU instructions starting at PC (looking at most limit instructions)
+    ## with a TLB the run stops at the end of a cached page, so every skipped fetch is a hit
+    def burstLength(self, limit = None):
+        count = 0
+        pc = self._pc
+        cachedRun = self._mmu.cachedRun(pc)
+        if cachedRun is not None:
+            limit = cachedRun if limit is None else min(limit, cachedRun)
+        while (limit is None) or (count < limit):
+            try:
+                instruction = self._mmu.peek(pc)
+            except (PageFault, AddressFault):
+                break
+            if OPCODES[instruction] != OPCODE_CPU:
+                break
+            count += 1
+            pc += 1
+        return count
+
     def _fetch(self):
         self._ir = self._mmu.fetch(self._pc)
         self._pc += 1
+        self._instructionsCount += 1
 
+    ## the instruction read from memory may be a string or an opcode (EncodedMemory)
     def _decode(self):
-        ## decode no hace nada en este caso
-        pass
+        self._opcode = OPCODES[self._ir]
 
-    def _stats(self):
+    ## the #STAT irq parameters are the number of ticks it accounts for (None = 1 tick)
+    def _stats(self, ticks = None):
         if self._enable_stats:
-            statsIRQ = IRQ(STAT_INTERRUPTION_TYPE)
+            statsIRQ = IRQ(STAT_INTERRUPTION_TYPE, ticks)
             self._interruptVector.handle(statsIRQ)
 
     def _execute(self):
-        if ASM.isEXIT(self._ir):
-            killIRQ = IRQ(KILL_INTERRUPTION_TYPE)
+        if self._opcode == OPCODE_EXIT:
+            killIRQ = IRQ(KILL_INTERRUPTION_TYPE, None, self._coreId)
             self._interruptVector.handle(killIRQ)
-        elif ASM.isIO(self._ir):
-            ioInIRQ = IRQ(IO_IN_INTERRUPTION_TYPE, self._ir)
+        elif self._opcode == OPCODE_IO:
+            ioInIRQ = IRQ(IO_IN_INTERRUPTION_TYPE, INSTRUCTION_IO, self._coreId)
             self._interruptVector.handle(ioInIRQ)
         else:
-            log.logger.info("cpu - Exec: {instr}, PC={pc}".format(instr=self._ir, pc=self._pc))
+            log.logger.info("cpu - Exec: {instr}, PC={pc}".format(instr=INSTRUCTIONS[self._opcode], pc=self._pc))
 
     def isBusy(self):
         return self._pc > -1
 
+    def isStalled(self):
+        return self._stallCycles > 0
+
+    @property
+    def coreId(self):
+        return self._coreId
+
+    ## while stalled the fetched instruction did not execute yet: its address is the PC to save
     @property
     def pc(self):
+        if self._stallCycles > 0:
+            return self._pc - 1
         return self._pc
 
     @pc.setter
     def pc(self, addr):
+        if self._stallCycles > 0:
+            self._stallCycles = 0
+            self._instructionsCount -= 1
         self._pc = addr
 
     @property
     def enable_stats(self):
         return self._enable_stats
 
+    @property
+    def burstMode(self):
+        return self._burstMode
+
+    @property
+    def instructionsCount(self):
+        return self._instructionsCount
+
+    @burstMode.setter
+    def burstMode(self, burstMode):
+        self._burstMode = burstMode
+
     @enable_stats.setter
     def enable_stats(self, enable_stats):
         self._enable_stats = enable_stats
 
     def __repr__(self):
-        return "CPU(PC={pc})".format(pc=self._pc)
+        return "CPU{core}(PC={pc})".format(core=self._coreId, pc=self._pc)
 
 ## emulates an Input/output device of the Hardware
 class AbstractIODevice():
 
-    def __init__(self, deviceId, deviceTime):
+    def __init__(self, deviceId, deviceTime, interruptVector, clock):
         self._deviceId = deviceId
         self._deviceTime = deviceTime
+        self._interruptVector = interruptVector
+        self._clock = clock
         self._busy = False
 
     @property
@@ -287,53 +1320,86 @@ class AbstractIODevice():
     def is_idle(self):
         return not self._busy
 
-    ## executes an I/O instruction
+    ## executes an I/O instruction: instead of counting ticks, the completion
+    ## is registered in the clock for the tick the operation finishes
     def execute(self, operation):
         if (self._busy):
             raise Exception("Device {id} is busy, can't  execute operation: {op}".format(id = self.deviceId, op = operation))
         else:
             self._busy = True
-            self._ticksCount = 0
             self._operation = operation
+            finishTick = self._clock.currentTick + self._deviceTime + 1
+            self._clock.schedule(finishTick, self._finish)
+            log.logger.info("device {deviceId} - Busy until tick {finishTick}".format(deviceId = self.deviceId, finishTick = finishTick))
 
-    def tick(self, tickNbr):
-        if (self._busy):
-            self._ticksCount += 1
-            if (self._ticksCount > self._deviceTime):
-                ## operation execution has finished
-                self._busy = False
-                ioOutIRQ = IRQ(IO_OUT_INTERRUPTION_TYPE, self._deviceId)
-                HARDWARE.interruptVector.handle(ioOutIRQ)
-            else:
-                log.logger.info("device {deviceId} - Busy: {ticksCount} of {deviceTime}".format(deviceId = self.deviceId, ticksCount = self._ticksCount, deviceTime = self._deviceTime))
+    def _finish(self):
+        ## operation execution has finished
+        self._busy = False
+        ioOutIRQ = IRQ(IO_OUT_INTERRUPTION_TYPE, self._deviceId)
+        self._interruptVector.handle(ioOutIRQ)
 
 
 class PrinterIODevice(AbstractIODevice):
-    def __init__(self):
-        super(PrinterIODevice, self).__init__("Printer", 3)
+    def __init__(self, interruptVector, clock):
+        super(PrinterIODevice, self).__init__("Printer", 3, interruptVector, clock)
 
 
 class Timer:
 
-    def __init__(self, cpu, interruptVector):
+    def __init__(self, cpu, interruptVector, clock):
         self._cpu = cpu
         self._interruptVector = interruptVector
-        self._tickCount = 0    # cantidad de de ciclos “ejecutados” por el proceso actual
+        self._clock = clock
+        self._startTick = 0     # primer tick “ejecutado” por el proceso actual
+        self._lastTick = None   # ultimo tick en el que corrio el timer
+        self._expiry = None     # vencimiento registrado en el clock
+        self._expired = False
         self._active = False    # por default esta desactivado
         self._quantum = 0   # por default esta desactivado
 
     def tick(self, tickNbr):
-        if self._active and (self._tickCount >= self._quantum) and self._cpu.isBusy():
+        if self._expired and self._cpu.isBusy():
             # se “cumplio” el limite de ejecuciones
-            timeoutIRQ = IRQ(TIMEOUT_INTERRUPTION_TYPE)
+            # (el proceso que carga el #TIMEOUT ya corre en este tick, asi que cuenta desde este tick)
+            timeoutIRQ = IRQ(TIMEOUT_INTERRUPTION_TYPE, None, self._cpu.coreId)
             self._interruptVector.handle(timeoutIRQ)
 
-        # registro que el proceso en CPU corrio un ciclo mas
-        self._tickCount += 1
+        self._lastTick = tickNbr
         self._cpu.tick(tickNbr)
 
+    ## when idle there is nothing to wait for. While busy the CPU runs tick by tick,
+    ## unless it is in burst mode: then the run of plain CPU instructions can be skipped
+    ## (the quantum expiry is in the clock, so it is already part of the limit)
+    def ticksToNextEvent(self, limit = None):
+        if not self._cpu.isBusy():
+            return None
+        if self._expired or self._cpu.isStalled() or not self._cpu.burstMode:
+            return 0
+        return self._cpu.burstLength(limit)
+
+    def advance(self, ticks):
+        self._cpu.advance(ticks)
+
     def reset(self):
-           self._tickCount = 0
+        ## si el timer ya corrio en este tick, el proceso empieza a contar en el proximo
+        if self._lastTick == self._clock.currentTick:
+            self._startTick = self._clock.currentTick + 1
+        else:
+            self._startTick = self._clock.currentTick
+        self._scheduleExpiry()
+
+    ## registra en el clock el tick en que se cumple el quantum
+    def _scheduleExpiry(self):
+        if self._expiry is not None:
+            self._clock.cancel(self._expiry)
+            self._expiry = None
+        self._expired = False
+        if self._active:
+            self._expiry = self._clock.schedule(self._startTick + self._quantum, self._expire, background = True)
+
+    def _expire(self):
+        self._expiry = None
+        self._expired = True
 
     @property
     def quantum(self):
@@ -343,23 +1409,72 @@ class Timer:
     def quantum(self, quantum):
         self._active = True
         self._quantum = quantum
+        self._scheduleExpiry()
+
+
+## emulates a processor core: its own Cpu, MMU and Timer
+## (the Memory and the InterruptVector are shared by all the cores)
+class Core():
+
+    def __init__(self, coreId, memory, interruptVector, clock, tlbSize = None, tlbPolicy = TLB_LRU, tlbMissPenalty = 0):
+        self._coreId = coreId
+        self._mmu = MMU(memory, tlbSize, tlbPolicy, tlbMissPenalty)
+        self._cpu = Cpu(self._mmu, interruptVector, coreId)
+        self._timer = Timer(self._cpu, interruptVector, clock)
+
+    @property
+    def coreId(self):
+        return self._coreId
+
+    @property
+    def cpu(self):
+        return self._cpu
+
+    @property
+    def mmu(self):
+        return self._mmu
+
+    @property
+    def timer(self):
+        return self._timer
 
 
 ## emulates the Hardware that were the Operative System run
 class Hardware():
 
     ## Setup our hardware
-    def setup(self, memorySize):
+    ## cores: number of cores (each one with its own Cpu, MMU and Timer)
+    ## virtualTime=True runs the clock as fast as the host allows (no sleep between ticks)
+    ## tickPeriod: seconds per tick in real time mode
+    ## idlePolicy: what the clock does when the kernel is idle (IDLE_TICK, IDLE_HALT or IDLE_WAIT)
+    ## memoryType: 'list' (one string per cell), 'encoded' (one opcode byte per cell)
+    ##             'mmap' (encoded, in an anonymous mmap) or 'sparse' (only the frames written)
+    ## memoryImage: file for an mmap memory that is kept (and reused) across runs
+    ## eventDriven=True uses the EventClock, which also skips the idle ticks
+    ## burstMode=True also retires runs of CPU instructions in one step (implies eventDriven)
+    ## tlbSize: entries of the TLB of each MMU (None = no TLB), tlbPolicy: TLB_LRU, TLB_RANDOM or TLB_CLOCK
+    ## tlbMissPenalty: extra cycles a TLB miss costs
+    def setup(self, memorySize, cores = 1, virtualTime = False, tickPeriod = 1, eventDriven = False, burstMode = False, idlePolicy = IDLE_WAIT, memoryType = 'list', memoryImage = None,
+              tlbSize = None, tlbPolicy = TLB_LRU, tlbMissPenalty = 0):
         ## add the components to the "motherboard"
-        self._memory = Memory(memorySize)
+        if memoryImage is not None:
+            self._memory = MmapMemory(memorySize, memoryImage)
+        else:
+            self._memory = MEMORY_TYPES[memoryType](memorySize)
         self._interruptVector = InterruptVector()
-        self._clock = Clock()
-        self._ioDevice = PrinterIODevice()
-        self._mmu = MMU(self._memory)
-        self._cpu = Cpu(self._mmu, self._interruptVector)
-        self._timer = Timer(self._cpu, self._interruptVector)
-        self._clock.addSubscriber(self._ioDevice)
-        self._clock.addSubscriber(self._timer)
+        if eventDriven or burstMode:
+            self._clock = EventClock(idlePolicy)
+        else:
+            self._clock = Clock(virtualTime, tickPeriod, idlePolicy)
+        self._clock.onHalt = self.logSummary
+        self._ioDevice = PrinterIODevice(self._interruptVector, self._clock)
+        self._cores = []
+        for coreId in range(cores):
+            core = Core(coreId, self._memory, self._interruptVector, self._clock, tlbSize, tlbPolicy, tlbMissPenalty)
+            core.cpu.burstMode = burstMode
+            self._cores.append(core)
+        for core in self._cores:
+            self._clock.addSubscriber(core.timer)
 
     def switchOn(self):
         log.logger.info(" ---- SWITCH ON ---- ")
@@ -369,9 +1484,40 @@ class Hardware():
         self.clock.stop()
         log.logger.info(" ---- SWITCH OFF ---- ")
 
+    ## run the next clock cycle synchronously (without the clock thread)
+    def step(self):
+        self.clock.step()
+
+    ## nothing running on the cores, no device busy and no arrival pending
+    def isIdle(self):
+        for core in self._cores:
+            if core.cpu.isBusy():
+                return False
+        return self._ioDevice.is_idle and self._clock.pendingWork == 0
+
+    def logSummary(self):
+        log.logger.info("---- :::: RUN SUMMARY: {ticks} ticks, {instructions} instructions, {interrupts} interrupts, {overruns} overruns ::: -----".format(
+            ticks = self._clock.currentTick + 1,
+            instructions = sum(core.cpu.instructionsCount for core in self._cores),
+            interrupts = self._interruptVector.handledCount,
+            overruns = self._clock.overruns))
+        for core in self._cores:
+            if core.mmu.tlb is not None:
+                log.logger.info("---- :::: CORE {coreId}: {tlb} ::: -----".format(coreId = core.coreId, tlb = core.mmu.tlb))
+
+    ## asyncio entry point: runs the clock in the current event loop until the machine is idle
+    ##   await hardware.run_until_idle()
+    async def run_until_idle(self):
+        await self._clock.run_until(self.isIdle)
+
+    @property
+    def cores(self):
+        return self._cores
+
+    ## cpu, mmu and timer of the first core
     @property
     def cpu(self):
-        return self._cpu
+        return self._cores[0].cpu
 
     @property
     def clock(self):
@@ -387,7 +1533,7 @@ class Hardware():
 
     @property
     def mmu(self):
-        return self._mmu
+        return self._cores[0].mmu
 
     @property
     def ioDevice(self):
@@ -395,12 +1541,13 @@ class Hardware():
 
     @property
     def timer(self):
-        return self._timer
+        return self._cores[0].timer
 
     def __repr__(self):
-        return "HARDWARE state {cpu}\n{mem}".format(cpu=self._cpu, mem=self._memory)
+        return "HARDWARE state {cpus}\n{mem}".format(cpus=[core.cpu for core in self._cores], mem=self._memory)
 
 ### HARDWARE is a global variable
 ### can be access from any
+### (it is only the default machine: the Kernel gets its Hardware explicitly,
+### so more Hardware() instances can live in the same process)
 HARDWARE = Hardware()
-
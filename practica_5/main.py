@@ -12,13 +12,21 @@ if __name__ == '__main__':
 
     ## setup our hardware and set memory size to 25 "cells"
     HARDWARE.setup(28)
+    ## para correr sin esperar 1 segundo por tick (tiempo virtual):
+    # HARDWARE.setup(28, virtualTime=True)
+    ## para simular una maquina con 2 cores:
+    # HARDWARE.setup(28, cores=2)
+    ## para que el clock se apague (con un resumen) cuando terminan todos los programas:
+    # HARDWARE.setup(28, idlePolicy=IDLE_HALT)
 
     ## Switch on computer
     HARDWARE.switchOn()
 
     ## new create the Operative System Kernel
     # "booteamos" el sistema operativo
-    kernel = Kernel()
+    kernel = Kernel(HARDWARE)
+    ## para que los programas queden guardados en disco entre corridas (y no haya que volver a escribirlos):
+    # kernel = Kernel(HARDWARE, fileSystemPath='programas.fs')
 
    # Ahora vamos a guardar los programas en el FileSystem
     ##################
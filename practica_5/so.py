@@ -3,41 +3,105 @@
 from hardware import *
 import log
 import heapq
+import asyncio
+import bisect
+import itertools
 import math
+import mmap
+import os
+import struct
+from collections import deque
 
 ## emulates a compiled program
+## the instructions are kept run-length encoded and immutable: runs (instruction, count) of
+## the same instruction, so ASM.CPU(1000000) is a single run. They are only expanded
+## when the cells are written in memory (or if instructions is asked for)
 class Program():
 
     def __init__(self, instructions):
-        self._instructions = self.expand(instructions)
+        self._setRuns(self.encode(instructions))
 
+    def _setRuns(self, runs):
+        self._runs = tuple(runs)
+        ## starts[i] = index of the first instruction of run i (the last one is the size of the program)
+        self._starts = list(itertools.accumulate((count for _, count in self._runs), initial = 0))
+        self._instructions = None
+
+    @property
+    def runs(self):
+        return self._runs
+
+    ## all the instructions (expanded the first time they are asked for)
     @property
     def instructions(self):
+        if self._instructions is None:
+            self._instructions = tuple(itertools.chain.from_iterable(itertools.repeat(instruction, count) for instruction, count in self._runs))
         return self._instructions
 
-    def addInstr(self, instruction):
-        self._instructions.append(instruction)
+    def __len__(self):
+        return self._starts[-1]
 
-    def expand(self, instructions):
-        expanded = []
+    ## a new program with the instruction added at the end (this one does not change: the FILE_SYSTEM,
+    ## the pcbs and the page cache may be sharing it; to change a stored program write the new one)
+    def addInstr(self, instruction):
+        runs = list(self._runs)
+        self.appendRun(runs, instruction, 1)
+        program = Program.__new__(Program)
+        program._setRuns(runs)
+        return program
+
+    ## the runs of the instructions from start to end (without end)
+    def runsBetween(self, start, end):
+        end = min(end, len(self))
+        runs = []
+        index = bisect.bisect_right(self._starts, start) - 1
+        while start < end:
+            runEnd = min(self._starts[index + 1], end)
+            runs.append((self._runs[index][0], runEnd - start))
+            start = runEnd
+            index += 1
+        return runs
+
+    def pageCount(self, frameSize):
+        return -(-len(self) // frameSize)
+
+    ## the runs of the page pageId (of frameSize instructions)
+    def page(self, pageId, frameSize):
+        return self.runsBetween(pageId * frameSize, (pageId + 1) * frameSize)
+
+    def encode(self, instructions):
+        runs = []
         for i in instructions:
-            if isinstance(i, list):
+            if isinstance(i, InstructionRun):
+                ## is a run of the same instruction
+                self.appendRun(runs, i.instruction, i.count)
+            elif isinstance(i, list):
                 ## is a list of instructions
-                expanded.extend(i)
+                for instruction in i:
+                    self.appendRun(runs, instruction, 1)
             else:
                 ## a single instr (a String)
-                expanded.append(i)
+                self.appendRun(runs, i, 1)
 
         ## now test if last instruction is EXIT
         ## if not... add an EXIT as final instruction
-        last = expanded[-1]
-        if not ASM.isEXIT(last):
-            expanded.append(INSTRUCTION_EXIT)
-
-        return expanded
+        if not runs or not ASM.isEXIT(runs[-1][0]):
+            self.appendRun(runs, INSTRUCTION_EXIT, 1)
+
+        return runs
+
+    ## adds count times the instruction, joining it with the last run if it is the same instruction
+    @staticmethod
+    def appendRun(runs, instruction, count):
+        if count <= 0:
+            return
+        if runs and runs[-1][0] == instruction:
+            runs[-1] = (instruction, runs[-1][1] + count)
+        else:
+            runs.append((instruction, count))
 
     def __repr__(self):
-        return "Program({instructions})".format(instructions=self._instructions)
+        return "Program({runs})".format(runs=self._runs)
 
 
 ## emulates an Input/Output device controller (driver)
@@ -55,6 +119,10 @@ class IoDeviceController():
         # try to send the instruction to hardware's device (if is idle)
         self.__load_from_waiting_queue_if_apply()
 
+    ## no hay pcb usando el dispositivo ni esperando
+    def isIdle(self):
+        return self._currentPCB is None and len(self._waiting_queue) == 0
+
     def getFinishedPCB(self):
         finishedPCB = self._currentPCB
         self._currentPCB = None
@@ -87,30 +155,114 @@ class AbstractInterruptionHandler():
     def execute(self, irq):
         log.logger.error("-- EXECUTE MUST BE OVERRIDEN in class {classname}".format(classname=self.__class__.__name__))
 
-    def expropiate(self, pcbRunning, pcb):
-        self.kernel._dispatcher.save(pcbRunning)
+    def expropiate(self, pcbRunning, pcb, core = 0):
+        self.kernel._dispatcher.save(pcbRunning, core)
         pcbRunning.cambiarState("ready")
         self.kernel._scheduler.add(pcbRunning)
-        self.kernel._pcbTable.setRunningPcb(pcb)
+        self.kernel._pcbTable.setRunningPcb(pcb, core)
         pcb.cambiarState("running")
-        self.kernel._dispatcher.load(pcb)
+        self.kernel._dispatcher.load(pcb, core)
+
+    ## Carga la pagina del pcb y la mapea en su tabla de paginas
+    ## (la tabla es la misma lista instalada en el MMU, y una pagina que no estaba cargada no tiene entradas en el TLB)
+    ## Si la pagina se habia modificado y desalojado se trae del swap; si no, si otro proceso del mismo
+    ## programa ya la tiene cargada se comparte su frame, y si no se carga del FILE_SYSTEM en un frame (libre o desalojado)
+    def loadPage(self, pcb, pageId):
+        memoryManager = self.kernel._memoryManager
+        frameId = None
+        if not self.kernel._swap.contains(pcb.getPid(), pageId):
+            frameId = memoryManager.shareFrame(self.kernel._loader.pageKey(pcb, pageId), pcb, pageId)
+        if frameId is None:
+            frameId = memoryManager.allocFrame(pcb, pageId)
+            if not self.kernel._swap.swapIn(pcb.getPid(), pageId, frameId):
+                self.kernel._loader.loadPage(pcb, pageId, frameId)
+                memoryManager.cachePage(self.kernel._loader.pageKey(pcb, pageId), frameId)
+        pcb.getBaseDir()[pageId] = frameId
+
+    ## Hay donde cargar la pagina del pcb: compartida con otro proceso o en un frame libre o desalojable
+    def canLoadPage(self, pcb, pageId):
+        if self.kernel._memoryManager.canAllocFrame():
+            return True
+        return (not self.kernel._swap.contains(pcb.getPid(), pageId)) and \
+            self.kernel._memoryManager.isCached(self.kernel._loader.pageKey(pcb, pageId))
+
+    ## Carga el programa del pcb en memoria (con paginacion bajo demanda solo arma su tabla de paginas,
+    ## las paginas se cargan cuando el proceso las usa, ver PageFaultInterruptionHandler) y lo pone a competir por un core
+    def admit(self, pcb):
+        if self.kernel._demandPaging:
+            baseDir = self.kernel._loader.pageTable(pcb)
+        else:
+            baseDir = self.kernel._loader.load_program(pcb)
+        print(baseDir)
+        ## Le asigna una _baseDir y cambia el estado a "ready"
+        pcb.modificaBaseDir(baseDir)
+        pcb.cambiarState("ready")
 
-    def pcbRunning(self, pcb):
+        ## Consulta el estado de los cores
+        self.assignCore(pcb)
+
+    ## Admite los pcb que esperan en "new" (en orden de llegada) mientras haya frames para cargarlos
+    def admitNew(self):
+        admissionQueue = self.kernel._admissionQueue
+        while admissionQueue and self.kernel._memoryManager.freeFrameCount() >= self.kernel._loader.framesNeeded(admissionQueue[0]):
+            self.admit(admissionQueue.pop(0))
+
+    ## Los pcb que esperaban un frame libre cargan su pagina y vuelven a competir por un core
+    def resumeFrameWaiters(self):
+        waitingQueue = self.kernel._frameWaitingQueue
+        while waitingQueue and self.canLoadPage(waitingQueue[0]['pcb'], waitingQueue[0]['pageId']):
+            pair = waitingQueue.pop(0)
+            self.loadPage(pair['pcb'], pair['pageId'])
+            self.assignCore(pair['pcb'])
+
+    def pcbRunning(self, pcb, core = 0):
         pcb.cambiarState("running")
-        self.kernel._pcbTable.setRunningPcb(pcb)
-        self.kernel._dispatcher.load(pcb)
+        self.kernel._pcbTable.setRunningPcb(pcb, core)
+        self.kernel._dispatcher.load(pcb, core)
+
+    ## Pone a correr el pcb en un core libre, si no hay expropia un core (si el scheduler lo indica)
+    ## y si no lo deja en la readyQueue
+    def assignCore(self, pcb):
+        core = self.kernel._pcbTable.getIdleCore()
+        if (core is not None):
+            ## Cambia El estado del pcb a "running" y lo carga en el CPU() del core libre
+            self.pcbRunning(pcb, core)
+            return
+        core = self.coreToExpropiate(pcb)
+        if (core is not None):
+            self.expropiate(self.kernel._pcbTable.getRunningPcb(core), pcb, core)
+        else:
+            ## Modifica el estado del pcb() asignado a la variable pcb a "ready"
+            pcb.cambiarState("ready")
+            ## Almacena el pcb() de la variable pcb en la _arrayPCB de la _readyQueue()
+            self.kernel._scheduler.add(pcb)
+
+    ## De los cores que el scheduler expropiaria, elige el que corre el pcb de menor prioridad
+    def coreToExpropiate(self, pcb):
+        candidate = None
+        for core, pcbRunning in enumerate(self.kernel._pcbTable.getRunningPcbs()):
+            if self.kernel._scheduler.mustExpropiate(pcbRunning, pcb):
+                if (candidate is None) or (pcbRunning.getPriority() > self.kernel._pcbTable.getRunningPcb(candidate).getPriority()):
+                    candidate = core
+        return candidate
 
 
 class KillInterruptionHandler(AbstractInterruptionHandler):
 
     def execute(self, irq):
 
-        killpcb = self.kernel._pcbTable.getRunningPcb()
-        self.kernel._dispatcher.save(killpcb)
+        core = irq.core
+        killpcb = self.kernel._pcbTable.getRunningPcb(core)
+        self.kernel._dispatcher.save(killpcb, core)
         killpcb.cambiarState("terminated")
-        self.kernel._pcbTable.setRunningPcb(None)
-        self.kernel._memoryManager.freeFrames(killpcb.getBaseDir())
-        print(self.kernel._memoryManager._freeFrames)
+        killpcb.setFinishTick(self.kernel.hardware.clock.currentTick)
+        self.kernel._pcbTable.setRunningPcb(None, core)
+        ## sus entradas del TLB ya no sirven (en ningun core)
+        for hardwareCore in self.kernel.hardware.cores:
+            hardwareCore.mmu.releaseAddressSpace(killpcb.getPid())
+        self.kernel._memoryManager.freeFrames(killpcb.getBaseDir(), killpcb)
+        self.kernel._swap.remove(killpcb.getPid())
+        print(self.kernel._memoryManager.freeFrameCount())
         ## Consultado el estado del _arrayPCB en la _readyQueue()
         if (self.kernel._scheduler.NotIsEmpty()):
 
@@ -119,13 +271,26 @@ class KillInterruptionHandler(AbstractInterruptionHandler):
             ## Modifica el estado del pcb() asignado a la variable newPCB a "ready"
             newPCB.cambiarState("running")
             ##  Carga pcb() de la variable newPCB en el CPU()
-            self.kernel._dispatcher.load(newPCB)
+            self.kernel._dispatcher.load(newPCB, core)
             ##
-            self.kernel._pcbTable.setRunningPcb(newPCB)
+            self.kernel._pcbTable.setRunningPcb(newPCB, core)
+
+        ## Los frames liberados pueden destrabar a los pcb que esperaban uno y admitir a los que estan en "new"
+        self.resumeFrameWaiters()
+        self.admitNew()
 
         ## Imprim iprime el aviso de programa finalizado
         log.logger.info(" Program Finished ")
 
+        ## Si no queda nada por hacer se lo avisa al hardware
+        self.kernel.checkIdle()
+
+        ## Avisa que termino (ver Kernel.run_async) desde el clock al empezar el proximo tick, fuera del irq:
+        ## onFinish puede volver a llamar a kernel.run (y el lock del InterruptVector no es reentrante)
+        onFinish = killpcb.getOnFinish()
+        if onFinish is not None:
+            self.kernel.hardware.clock.schedule(self.kernel.hardware.clock.currentTick, lambda: onFinish(killpcb))
+
         ## Imprime el estado del _pcbTable
         log.logger.info(self.kernel._pcbTable.__repr__())
 
@@ -138,14 +303,15 @@ class IoInInterruptionHandler(AbstractInterruptionHandler):
         print("esto Esta Corriendo")
         ##
         operation = irq.parameters
-        ## Obtiene el pcb() que tiene el _state "running" de la _pcbTable() y lo asigna a una variable
-        pcb = self.kernel._pcbTable.getRunningPcb()
+        core = irq.core
+        ## Obtiene el pcb() que tiene el _state "running" en el core de la _pcbTable() y lo asigna a una variable
+        pcb = self.kernel._pcbTable.getRunningPcb(core)
         ## Salava el pc del cpu() y se lo asigna al pcb() almacenado en la variable pcb
-        self.kernel._dispatcher.save(pcb)
+        self.kernel._dispatcher.save(pcb, core)
         ## Cambia el _state del pcb() asignado a la variable pcb a "waiting"
         pcb.cambiarState("waiting")
         ##
-        self.kernel._pcbTable.setRunningPcb(None)
+        self.kernel._pcbTable.setRunningPcb(None, core)
 
         ## Delega el manejo del pcb() asignado a la variable pcb al ioDeviceController()
         self.kernel.ioDeviceController.runOperation(pcb, operation)
@@ -157,9 +323,9 @@ class IoInInterruptionHandler(AbstractInterruptionHandler):
             ## Cambia el _state del pcb() asignado a la variable newPCB a "waiting"
             newPCB.cambiarState("running")
             ##
-            self.kernel._pcbTable.setRunningPcb(newPCB)
+            self.kernel._pcbTable.setRunningPcb(newPCB, core)
             ## Carga el pcb() asignado a la variable newPCB en el cpu()
-            self.kernel._dispatcher.load(newPCB)
+            self.kernel._dispatcher.load(newPCB, core)
 
         ## Imprime el estado del _pcbTable
         log.logger.info(self.kernel._pcbTable.__repr__())
@@ -171,18 +337,7 @@ class IoOutInterruptionHandler(AbstractInterruptionHandler):
         print("esto Esta Corriendo")
         ## Obtiene el pcb() de la salida del ioDeviceController() y lo asigna a la variable pcb
         pcb = self.kernel.ioDeviceController.getFinishedPCB()
-        pcbRunning = self.kernel._pcbTable.getRunningPcb()
-
-        if(pcbRunning == None):
-            ## Cambia El estado del pcb a "running" y lo carga en el CPU()
-            self.pcbRunning(pcb)
-        elif (self.kernel._scheduler.mustExpropiate(pcbRunning, pcb)):
-            self.expropiate(pcbRunning, pcb)
-        else:
-            ## Modifica el estado del pcb() asignado a la variable pcb a "ready"
-            pcb.cambiarState("ready")
-            ## Almacena el pcb() de la variable pcb en la _arrayPCB de la _readyQueue()
-            self.kernel._scheduler.add(pcb)
+        self.assignCore(pcb)
 
         ## Imprime el estado del _pcbTable
         log.logger.info(self.kernel._pcbTable.__repr__())
@@ -198,26 +353,23 @@ class NewInterruptionHandler(AbstractInterruptionHandler):
 
         ## Crea un nuevo PCB() - le asigna un pid unico y lo inicia con el estado en "new"
         pcb = PCB(self.kernel._pcbTable.getNewPID(), 0, 0, "new", priority)
-        ## Carga los parametros en memoria
-        baseDir = self.kernel._loader.load_program(path)
-        print(baseDir)
-        ## Le asigna una _baseDir y cambia el estado a "ready"
-        pcb.modificaBaseDir(baseDir)
-        pcb.cambiarState("ready")
-
-        pcbRunning = self.kernel._pcbTable.getRunningPcb()
-
-        ## Consulta el estado del cpu
-        if(pcbRunning == None):
-            ## Cambia El estado del pcb a "running" y lo carga en el CPU()
-            self.pcbRunning(pcb)
-        elif (self.kernel._scheduler.mustExpropiate(pcbRunning, pcb)):
-            self.expropiate(pcbRunning, pcb)
+        pcb.setTick(self.kernel.hardware.clock.currentTick)
+        pcb.setOnFinish(parameters.get('onFinish'))
+        ## El pcb se queda con el programa que habia en el path al crearse (el archivo se puede reescribir despues)
+        pcb.setPath(path)
+        pcb.setProgram(self.kernel.fileSystem.read(path), self.kernel.fileSystem.version(path))
+        if self.kernel._demandPaging:
+            self.admit(pcb)
         else:
-            self.kernel._scheduler.add(pcb)
+            if (not self.kernel._admissionQueue) and self.kernel._memoryManager.freeFrameCount() >= self.kernel._loader.framesNeeded(pcb):
+                self.admit(pcb)
+            else:
+                ## No hay frames suficientes: queda en "new" hasta que otros procesos liberen los suyos
+                self.kernel._admissionQueue.append(pcb)
 
         ## Almacena el pcb en la PCB_TABLE()
         self.kernel._pcbTable.add(pcb)
+        self.kernel.checkIdle()
 
         ## Imprime el estado del _pcbTable
         log.logger.info(self.kernel._pcbTable.__repr__())
@@ -225,23 +377,65 @@ class NewInterruptionHandler(AbstractInterruptionHandler):
 
 class StatInterruptionHandler(AbstractInterruptionHandler):
 
+    ## irq.parameters: cantidad de ticks que representa (None = 1, el EventClock puede saltear varios)
     def execute(self, irq):
+        ticks = irq.parameters or 1
+        ## Acumula el tiempo de espera en la readyQueue y en la cola de admision ("new") de cada pcb
+        for pcb in self.kernel._pcbTable._table:
+            if pcb._state == "ready":
+                pcb.addReadyTicks(ticks)
+            elif pcb._state == "new":
+                pcb.addNewTicks(ticks)
         #self.kernel._scheduler.checkTick()
         # self.kernel._diagramaDeGantt.activateGantt()
-        # self.kernel._diagramaDeGantt.hacerGantt()
+        # self.kernel._diagramaDeGantt.hacerGantt(ticks)
         pass
 
 
 class TimeoutInterruptionHandler(AbstractInterruptionHandler):
 
+    ## se cumplio el quantum del pcb que corre en irq.core (solo el SCHEDULER_RR activa el timer)
     def execute(self, irq):
-        # if self.kernel._scheduler.NotIsEmpty():
-        #     pcbRunning = self.kernel._pcbTable.getRunningPcb()
-        #     newPcb = self.kernel._scheduler.getNext()
-        #     self.expropiate(pcbRunning, newPcb)
+        core = irq.core
+        if self.kernel._scheduler.NotIsEmpty():
+            ## el pcb vuelve al final de la readyQueue y corre el siguiente
+            pcbRunning = self.kernel._pcbTable.getRunningPcb(core)
+            newPcb = self.kernel._scheduler.getNext()
+            self.expropiate(pcbRunning, newPcb, core)
+        else:
+            ## nadie espera: sigue corriendo con un quantum nuevo
+            self.kernel.hardware.cores[core].timer.reset()
+
+        log.logger.info(self.kernel._pcbTable.__repr__())
 
-        # log.logger.info(self.kernel._pcbTable.__repr__())
-        pass
+
+class PageFaultInterruptionHandler(AbstractInterruptionHandler):
+
+    ## irq.parameters: la pagina que no esta en memoria
+    def execute(self, irq):
+        core = irq.core
+        pageId = irq.parameters
+        pcb = self.kernel._pcbTable.getRunningPcb(core)
+        self.kernel._memoryManager.countPageFault()
+        if self.canLoadPage(pcb, pageId):
+            ## Carga la pagina y el pcb sigue corriendo (el CPU vuelve a buscar la instruccion en el proximo tick)
+            ## con un quantum nuevo: el tick perdido en el fallo no se le descuenta, si no con quantum 1
+            ## el #TIMEOUT lo sacaria antes de usar la pagina y el siguiente proceso se la desalojaria
+            self.loadPage(pcb, pageId)
+            self.kernel.hardware.cores[core].timer.reset()
+        else:
+            ## No hay frames libres (ni politica de reemplazo): el pcb espera a que otro proceso libere los suyos
+            self.kernel._dispatcher.save(pcb, core)
+            pcb.cambiarState("waiting")
+            self.kernel._pcbTable.setRunningPcb(None, core)
+            self.kernel._frameWaitingQueue.append({'pcb': pcb, 'pageId': pageId})
+            if (self.kernel._scheduler.NotIsEmpty()):
+                newPCB = self.kernel._scheduler.getNext()
+                self.pcbRunning(newPCB, core)
+            self.kernel.checkIdle()
+
+        ## Imprime el estado del _pcbTable
+        log.logger.info(self.kernel._pcbTable.__repr__())
 
 
 #* Creacion el Object LOADER()
@@ -249,38 +443,68 @@ class LOADER():
     def __init__(self, kernel):
         self.kernel = kernel
 
-    def load_program(self, path):
-        program = self.kernel.fileSystem.read(path).instructions
+    ## Carga el programa del pcb en memoria: las paginas que otro proceso del mismo programa
+    ## ya tiene cargadas se comparten, solo las demas se cargan en frames nuevos
+    def load_program(self, pcb):
+        program = pcb.getProgram()
         frameSize = self.kernel._memoryManager.frameSize()
-        cantFreim = math.ceil(len(program) / frameSize)
-        pageTable = self.kernel._memoryManager.allocFrames(cantFreim)
-
-        self.cargar(pageTable, self.pager(cantFreim, frameSize, program), frameSize)
+        cantFreim = self.pageCount(pcb)
+        pageTable = []
+        missing = []
+        for pageId in range(cantFreim):
+            frameId = self.kernel._memoryManager.shareFrame(self.pageKey(pcb, pageId))
+            if frameId is None:
+                missing.append(pageId)
+            pageTable.append(frameId)
+
+        pages = list(zip(missing, self.kernel._memoryManager.allocFrames(len(missing))))
+        for pageId, frameId in pages:
+            pageTable[pageId] = frameId
+            self.kernel._memoryManager.cachePage(self.pageKey(pcb, pageId), frameId)
+        self.cargar(pages, program, frameSize)
 
         return pageTable
+
+    ## Clave de la pagina en el cache de paginas del MEMORY_MANAGER: (path, version, pageId)
+    def pageKey(self, pcb, pageId):
+        return (pcb.getPath(), pcb.getVersion(), pageId)
+
+    ## Cantidad de frames nuevos que necesita el programa del pcb (las paginas en el cache no)
+    def framesNeeded(self, pcb):
+        needed = 0
+        for pageId in range(self.pageCount(pcb)):
+            if not self.kernel._memoryManager.isCached(self.pageKey(pcb, pageId)):
+                needed += 1
+        return needed
+
+    ## Tabla de paginas del programa sin ninguna pagina cargada (paginacion bajo demanda)
+    def pageTable(self, pcb):
+        return [None] * self.pageCount(pcb)
+
+    ## Cantidad de paginas del programa del pcb
+    def pageCount(self, pcb):
+        return pcb.getProgram().pageCount(self.kernel._memoryManager.frameSize())
+
+    ## Carga la pagina pageId del programa del pcb en el frame dado
+    def loadPage(self, pcb, pageId, frameId):
+        frameSize = self.kernel._memoryManager.frameSize()
+        self.mini_cargar(pcb.getProgram().page(pageId, frameSize), frameId, frameSize)
     
-    def cargar(self, pageTable, pager, frameSize):
-        for i in pageTable:
-            e = pager.pop(0)
-            self.mini_cargar(e, i, frameSize)
-            
-
-    def mini_cargar(self, inst, base, frameSize):
-        for i in range(len(inst)):
-            HARDWARE.memory.write((base * frameSize) + i, inst[i])
-
-    def pager(self, cantFreim, frameSize, program):
-        temporal = []
-        for _ in range(cantFreim):
-            temporal.append(self.mini_pager(frameSize, program))
-        return temporal
-    
-    def mini_pager(self, frameSize, program):
-        temporal = []
-        for _ in range(frameSize):
-            if len(program) > 0:
-                temporal.append(program.pop(0))
-        return temporal
+    ## Copia las paginas dadas, pares (pageId, frameId) en orden, del programa:
+    ## cada tramo de paginas consecutivas en frames consecutivos se copia de una sola vez
+    def cargar(self, pages, program, frameSize):
+        start = 0
+        while start < len(pages):
+            end = start + 1
+            while end < len(pages) and pages[end][0] == pages[end - 1][0] + 1 and pages[end][1] == pages[end - 1][1] + 1:
+                end += 1
+            firstPage, firstFrame = pages[start]
+            self.mini_cargar(program.runsBetween(firstPage * frameSize, (firstPage + end - start) * frameSize), firstFrame, frameSize)
+            start = end
+
+    ## copia los runs (instruccion, cantidad) a partir del frame base, cada run de una sola vez
+    def mini_cargar(self, runs, base, frameSize):
+        self.kernel.hardware.memory.write_runs(base * frameSize, runs)
 
     # ## Carga el prograa dado en memoria
     # def load_program(self, program):
@@ -295,9 +519,10 @@ class LOADER():
 #* Creacion el Object PCB_TABLE()
 class PCB_TABLE():
 
-    def __init__(self):
+    ## cores: cantidad de cores, se guarda un pcb corriendo por cada core
+    def __init__(self, cores = 1):
         self._table = []
-        self._runningPcb = None
+        self._runningPcb = [None] * cores
 
     ## Retorna el pcb con el pid proporsionado
     def get(self, pid):
@@ -305,13 +530,31 @@ class PCB_TABLE():
             if pid == index.getPid():
                 return index
 
-    def setRunningPcb(self, arg):
-        self._runningPcb = arg
+    def setRunningPcb(self, arg, core = 0):
+        self._runningPcb[core] = arg
 
-    ## Retorna el pcb() que tiene el estado "running"
-    def getRunningPcb(self):
+    ## Retorna el pcb() que tiene el estado "running" en el core
+    def getRunningPcb(self, core = 0):
+        return self._runningPcb[core]
+
+    ## Retorna los pcb() corriendo, uno por core (None si el core esta IDLE)
+    def getRunningPcbs(self):
         return self._runningPcb
 
+    ## Indica si ningun core tiene un pcb corriendo
+    def noneRunning(self):
+        for pcb in self._runningPcb:
+            if pcb is not None:
+                return False
+        return True
+
+    ## Retorna el primer core IDLE (None si todos estan ocupados)
+    def getIdleCore(self):
+        for core, pcb in enumerate(self._runningPcb):
+            if pcb is None:
+                return core
+        return None
+
     ## Agrega un pcb a table
     def add(self, pcb):
         self._table.append(pcb)
@@ -324,6 +567,18 @@ class PCB_TABLE():
                 varTem.extend([index])
         self._table = varTem
 
+    ## Retorna todos los pcb()
+    def getAll(self):
+        return self._table
+
+    ## Cantidad de pcb() con estado "terminated"
+    def terminatedCount(self):
+        count = 0
+        for pcb in self._table:
+            if pcb._state == "terminated":
+                count += 1
+        return count
+
     ## Crea un _pid unico y lo retorna
     def getNewPID(self):
         if len(self._table) == 0:
@@ -348,13 +603,76 @@ class PCB():
         self._pc = pc
         self._state = state
         self._prioridad = prioridad
-
+        self._tickIng = 0
+        self._finishTick = None
+        self._readyTicks = 0
+        self._newTicks = 0
+        self._onFinish = None
+        self._path = None
+        self._program = None
+        self._version = None
+
+    ## tick de ingreso
     def getTick(self):
         return self._tickIng
 
     def setTick(self, nuevoTick):
         self._tickIng = nuevoTick
 
+    ## tick en el que termino (None si no termino)
+    def getFinishTick(self):
+        return self._finishTick
+
+    def setFinishTick(self, tick):
+        self._finishTick = tick
+
+    ## ticks que paso en la readyQueue
+    def getReadyTicks(self):
+        return self._readyTicks
+
+    def addReadyTicks(self, ticks):
+        self._readyTicks += ticks
+
+    ## ticks que paso en "new" esperando frames para ser admitido
+    def getNewTicks(self):
+        return self._newTicks
+
+    def addNewTicks(self, ticks):
+        self._newTicks += ticks
+
+    ## ticks que paso esperando: en la readyQueue y en la cola de admision
+    def getWaitingTicks(self):
+        return self._readyTicks + self._newTicks
+
+    ## funcion a llamar con el pcb cuando termina (None si no hay)
+    def getOnFinish(self):
+        return self._onFinish
+
+    def setOnFinish(self, onFinish):
+        self._onFinish = onFinish
+
+    ## ticks desde que ingreso hasta que termino
+    def getTurnaround(self):
+        return self._finishTick - self._tickIng + 1
+
+    ## path del programa que corre
+    def getPath(self):
+        return self._path
+
+    def setPath(self, path):
+        self._path = path
+
+    ## programa que corre y su version en el FILE_SYSTEM (de ahi se cargan sus paginas)
+    def getProgram(self):
+        return self._program
+
+    def getVersion(self):
+        return self._version
+
+    def setProgram(self, program, version):
+        self._program = program
+        self._version = version
+
     def getPid(self):
         return self._pid
 
@@ -386,8 +704,8 @@ class PCB():
 
 class ABSTRACT_SCHEDULER():
 
-    def __init__(self):
-        pass
+    def __init__(self, kernel):
+        self.kernel = kernel
 
     def add(self, pcb):
         pass
@@ -407,7 +725,8 @@ class ABSTRACT_SCHEDULER():
 
 class SCHEDULER_FCFS(ABSTRACT_SCHEDULER):
 
-    def __init__(self):
+    def __init__(self, kernel):
+        super().__init__(kernel)
         self._readyQueue = []
 
     def add(self, pcb):
@@ -422,7 +741,8 @@ class SCHEDULER_FCFS(ABSTRACT_SCHEDULER):
 
 class SCHEDULER_PRIORIDAD_NO_EXP(ABSTRACT_SCHEDULER):
 
-    def __init__(self):
+    def __init__(self, kernel):
+        super().__init__(kernel)
         self._readyQueue = [[], [], [], [], []]
         self.tickToAge = 3
 
@@ -440,13 +760,13 @@ class SCHEDULER_PRIORIDAD_NO_EXP(ABSTRACT_SCHEDULER):
             cont += 1
 
     def envejecer(self, arr, poner):
-        while bool(arr) and (3 + arr[0]['tick'] <= HARDWARE.clock.currentTick):
+        while bool(arr) and (3 + arr[0]['tick'] <= self.kernel.hardware.clock.currentTick):
             arr[0]['priority'] -= 1
             poner.append(arr.pop(0))
 
     def add(self, pcb):
         priority = pcb.getPriority()
-        psItem = {'tick': HARDWARE.clock.currentTick, 'pcb': pcb, 'priority': priority}
+        psItem = {'tick': self.kernel.hardware.clock.currentTick, 'pcb': pcb, 'priority': priority}
         self._readyQueue[priority - 1].append(psItem)
 
     def getNext(self):
@@ -466,12 +786,13 @@ class SCHEDULER_PRIORIDAD_EXP(SCHEDULER_PRIORIDAD_NO_EXP):
 
 class SCHEDULER_RR(SCHEDULER_FCFS):
 
-    def __init__(self):
-        super().__init__()
-        self.setearTimer(3)
+    def __init__(self, kernel, quantum = 3):
+        super().__init__(kernel)
+        self.setearTimer(quantum)
 
     def setearTimer(self, quantum):
-        HARDWARE.timer.quantum = quantum
+        for core in self.kernel.hardware.cores:
+            core.timer.quantum = quantum
         # HARDWARE.timer._active = True
 
 class DIAGRAMA_DE_GANTT():
@@ -498,12 +819,13 @@ class DIAGRAMA_DE_GANTT():
                 return False
         return True
 
-    ## Guarda el state de cada PCB por cada tick
-    def tickInformation(self):
-        arrayPorTick = []
-        for pcb in self._pcbTable._table:
-            arrayPorTick.append(pcb._state) ## Guarda todos los PCB en ese tick en un array
-            self._copiaPcbTable.append(arrayPorTick) ## Guarda ese array en otro array para que quede un array para cada tick
+    ## Guarda el state de cada PCB por cada tick (ticks > 1 cuando el EventClock salteo ticks)
+    def tickInformation(self, ticks = 1):
+        for _ in range(ticks):
+            arrayPorTick = []
+            for pcb in self._pcbTable._table:
+                arrayPorTick.append(pcb._state) ## Guarda todos los PCB en ese tick en un array
+                self._copiaPcbTable.append(arrayPorTick) ## Guarda ese array en otro array para que quede un array para cada tick
 
     def printGantt(self):
         print(tabulate(self.mapGantt(), tablefmt = 'fancy_grid', showindex = True, headers = self.headersGantt()))
@@ -524,13 +846,13 @@ class DIAGRAMA_DE_GANTT():
             self._headers.append(index)
         return self._headers
 
-    # Devuelve un nuevo array donde "Terminated" es "T", "Ready" es ".", "Running" es "R" y "Waiting" es "W"
+    # Devuelve un nuevo array donde "Terminated" es "T", "Ready" es ".", "Running" es "R" , "Waiting" es "W" y "New" es "N"
     def mapGantt(self):
-        transformedArray = list(map(lambda sublist: ["T" if item == "terminated" else "." if item == "ready" else "W" if item == "waiting" else "R" for item in sublist], self.transposedArray()))
+        transformedArray = list(map(lambda sublist: ["T" if item == "terminated" else "." if item == "ready" else "W" if item == "waiting" else "N" if item == "new" else "R" for item in sublist], self.transposedArray()))
         return transformedArray
 
-    def hacerGantt(self):
-        self.tickInformation()
+    def hacerGantt(self, ticks = 1):
+        self.tickInformation(ticks)
         if(self.getIsActive() and self.allTerminated()):
             self.printGantt()
             self.desactivateGantt()
@@ -539,119 +861,640 @@ class DIAGRAMA_DE_GANTT():
 #* Creacion del Object DISPATCHER()
 class DISPATCHER():
 
-    ## Carga el pcb() dado en la CPU()
-    def load(self, pcb):
+    def __init__(self, kernel):
+        self.kernel = kernel
+
+    ## Carga el pcb() dado en la CPU() del core
+    def load(self, pcb, core = 0):
+        core = self.kernel.hardware.cores[core]
 
-        tbl = pcb.getBaseDir()
-         ## al hacer un context switch
-        HARDWARE.mmu.resetTLB()
-        for i in range(0, len(tbl), 1):
-            HARDWARE.mmu.setPageFrame(i, tbl[i])
+        ## al hacer un context switch solo se cambia el ASID (el pid) del MMU,
+        ## la tabla de paginas del pcb se instala tal cual (sin copiarla)
+        core.mmu.switchAddressSpace(pcb.getPid(), pcb.getBaseDir())
+        ## el limite del proceso es el final de su ultima pagina
+        core.mmu.limit = len(pcb.getBaseDir()) * core.mmu.frameSize - 1
 
-        HARDWARE.cpu.pc = pcb.getPc()
-        HARDWARE.timer.reset()
+        core.cpu.pc = pcb.getPc()
+        core.timer.reset()
 
-    ## Salva el estado de pc en un pcb() dado y pone el CPU() en IDLE
-    def save(self, pcb):
-        pcb.cambiarPc(HARDWARE.cpu.pc)
-        HARDWARE.cpu.pc = -1
+    ## Salva el estado de pc en un pcb() dado y pone el CPU() del core en IDLE
+    def save(self, pcb, core = 0):
+        core = self.kernel.hardware.cores[core]
+        pcb.cambiarPc(core.cpu.pc)
+        core.cpu.pc = -1
 
 #* Creacion del Object MEMOYI_MANAGER()
 class MEMORY_MANAGER():
     def __init__(self, kernel): 
-        self._frameSize = HARDWARE.mmu.frameSize
-        self._freeMem = HARDWARE.memory.size
-        self._freeFrames = []
-        self.calcFrameMemory(self._freeMem, self._frameSize)
-
-    def calcFrameMemory(self, mem, frameMem):
-        for i in range(int(mem / frameMem)):
-            self._freeFrames.append(i)
+        self.kernel = kernel
+        self._frameSize = kernel.hardware.mmu.frameSize
+        self._freeMem = kernel.hardware.memory.size
+        self._frameCount = self._freeMem // self._frameSize
+        ## frames libres, sin armar una lista con todos al bootear: los que nunca se usaron son los
+        ## de _nextFrame en adelante y los liberados se devuelven al final de _recycledFrames.
+        ## Se toman primero los nunca usados (en orden) y despues los liberados (en el orden en que se liberaron)
+        self._nextFrame = 0
+        self._recycledFrames = deque()
+        ## frame -> [(pcb, pageId)] de las paginas cargadas bajo demanda, las que se pueden desalojar
+        ## (un frame compartido tiene un duenio por cada proceso que lo mapea)
+        self._frameTable = dict()
+        ## cache de paginas de codigo: (path, version, pageId) -> frame, compartido por los procesos del mismo programa
+        self._pageCache = dict()
+        ## frame -> clave en el cache
+        self._cachedFrames = dict()
+        ## frame compartido -> cantidad de tablas de paginas que lo usan
+        self._refCounts = dict()
+        self._replacement = None
+        if kernel._pageReplacement is not None:
+            self._replacement = kernel._pageReplacement(kernel._pageReferences)
+        self._pageFaults = 0
+        self._evictions = 0
+        self._writeBacks = 0
 
     def allocFrames(self, int):
-        framePut = []
-        for i in range(int):
-            framePut.append(self._freeFrames.pop(0))
-            self._freeMem -= self._frameSize
+        if int > self.freeFrameCount():
+            raise IndexError("No hay {count} frames libres".format(count = int))
+        fresh = min(int, self._frameCount - self._nextFrame)
+        framePut = list(range(self._nextFrame, self._nextFrame + fresh))
+        self._nextFrame += fresh
+        framePut.extend(self._recycledFrames.popleft() for _ in range(int - fresh))
+        self._freeMem -= self._frameSize * int
         return framePut
 
-    def freeFrames(self, frames):
+    ## las paginas que no llegaron a cargarse (None) no tienen frame
+    ## un frame compartido solo se libera cuando lo suelta el ultimo proceso (pcb: el que lo suelta)
+    def freeFrames(self, frames, pcb = None):
         for i in frames:
-            self._freeFrames.append(i)
-            self._freeMem += self._frameSize
+            if i is not None:
+                owners = self._frameTable.get(i)
+                if owners is not None and pcb is not None:
+                    owners[:] = [owner for owner in owners if owner[0] is not pcb]
+                refCount = self._refCounts.get(i, 1)
+                if refCount > 1:
+                    self._refCounts[i] = refCount - 1
+                    continue
+                self.uncache(i)
+                if self._frameTable.pop(i, None) is not None:
+                    self.forget(i)
+                self._recycledFrames.append(i)
+                self._freeMem += self._frameSize
+
+    ## el frame tiene la pagina key, otros procesos la pueden compartir
+    def cachePage(self, key, frameId):
+        self._pageCache[key] = frameId
+        self._cachedFrames[frameId] = key
+        self._refCounts[frameId] = 1
+
+    def isCached(self, key):
+        return key in self._pageCache
+
+    ## el frame del cache con la pagina key, con una referencia mas (None si no esta)
+    ## pcb y pageId: el nuevo duenio, si el frame es desalojable
+    def shareFrame(self, key, pcb = None, pageId = None):
+        frameId = self._pageCache.get(key)
+        if frameId is not None:
+            self._refCounts[frameId] += 1
+            if frameId in self._frameTable:
+                self._frameTable[frameId].append((pcb, pageId))
+        return frameId
+
+    def uncache(self, frameId):
+        key = self._cachedFrames.pop(frameId, None)
+        if key is not None:
+            del self._pageCache[key]
+        self._refCounts.pop(frameId, None)
+
+    def hasFreeFrames(self):
+        return self.freeFrameCount() > 0
+
+    def freeFrameCount(self):
+        return self._frameCount - self._nextFrame + len(self._recycledFrames)
+
+    ## frames de toda la memoria
+    def frameCount(self):
+        return self._frameCount
+
+    ## hay un frame libre o uno que se puede desalojar
+    def canAllocFrame(self):
+        return self.hasFreeFrames() or (self._replacement is not None and len(self._frameTable) > 0)
+
+    ## Un frame para la pagina pageId del pcb: uno libre o, si no hay, el que elige la politica de reemplazo
+    def allocFrame(self, pcb, pageId):
+        if self.hasFreeFrames():
+            frameId = self.allocFrames(1)[0]
+        else:
+            frameId = self.evict()
+        self._frameTable[frameId] = [(pcb, pageId)]
+        if self._replacement is not None:
+            self._replacement.loaded(frameId, (pcb.getPid(), pageId))
+        if self.kernel._pageReferences is not None:
+            self.kernel._pageReferences.load(frameId)
+        return frameId
+
+    ## Desaloja la pagina del frame que elige la politica de reemplazo: si se modifico se escribe
+    ## en el swap, se saca de la tabla de paginas de sus duenios y del TLB de todos los cores
+    def evict(self):
+        frameId = self._replacement.victim()
+        owners = self._frameTable.pop(frameId)
+        dirty = self.kernel._pageReferences.dirty[frameId]
+        if dirty:
+            self._writeBacks += 1
+        for pcb, pageId in owners:
+            if dirty:
+                self.kernel._swap.swapOut(pcb.getPid(), pageId, frameId)
+            pcb.getBaseDir()[pageId] = None
+            for core in self.kernel.hardware.cores:
+                core.mmu.invalidatePage(pcb.getPid(), pageId)
+        self.uncache(frameId)
+        self.forget(frameId)
+        self._evictions += 1
+        return frameId
+
+    ## el frame ya no tiene la pagina: la politica y los bits de referencia se olvidan de el
+    def forget(self, frameId):
+        if self._replacement is not None:
+            self._replacement.freed(frameId)
+        if self.kernel._pageReferences is not None:
+            self.kernel._pageReferences.clear(frameId)
+
+    def countPageFault(self):
+        self._pageFaults += 1
+
+    ## metricas de la paginacion bajo demanda
+    def stats(self):
+        references = self.kernel._pageReferences
+        accesses = references.accesses if references is not None else None
+        return {
+            'pageFaults': self._pageFaults,
+            'evictions': self._evictions,
+            'writeBacks': self._writeBacks,
+            'swapIns': self.kernel._swap.swapIns,
+            'references': accesses,
+            'faultRate': self._pageFaults / accesses if accesses else None,
+        }
 
     def frameSize(self):
         return self._frameSize
 
 
+## Politicas de reemplazo de paginas: llevan los frames con paginas desalojables
+## y eligen cual desalojar mirando los bits de referencia y de modificacion (PageReferences)
+class ABSTRACT_PAGE_REPLACEMENT():
+
+    def __init__(self, references):
+        self._references = references
+        ## frame -> pagina (pid, pageId), en orden de carga
+        self._frames = dict()
+
+    ## el frame recibio la pagina
+    def loaded(self, frameId, page):
+        self._frames[frameId] = page
+
+    ## el frame quedo libre
+    def freed(self, frameId):
+        self._frames.pop(frameId, None)
+
+    ## posicion en la reference string (solo la usa el optimo)
+    def seek(self, position):
+        pass
+
+    ## el frame a desalojar
+    def victim(self):
+        pass
+
+
+## desaloja la pagina cargada hace mas tiempo
+class PAGE_REPLACEMENT_FIFO(ABSTRACT_PAGE_REPLACEMENT):
+
+    def victim(self):
+        return next(iter(self._frames))
+
+
+## desaloja la pagina usada hace mas tiempo
+class PAGE_REPLACEMENT_LRU(ABSTRACT_PAGE_REPLACEMENT):
+
+    def victim(self):
+        return min(self._frames, key = self._references.referenced.__getitem__)
+
+
+## clock (segunda oportunidad): la aguja saltea (y limpia) los frames referenciados
+class PAGE_REPLACEMENT_CLOCK(ABSTRACT_PAGE_REPLACEMENT):
+
+    def __init__(self, references):
+        super().__init__(references)
+        self._ring = []
+        self._hand = 0
+
+    ## la pagina nueva queda justo detras de la aguja
+    def loaded(self, frameId, page):
+        super().loaded(frameId, page)
+        self._ring.insert(self._hand, frameId)
+        self._hand = (self._hand + 1) % len(self._ring)
+
+    def freed(self, frameId):
+        super().freed(frameId)
+        if frameId in self._ring:
+            index = self._ring.index(frameId)
+            self._ring.pop(index)
+            if index < self._hand:
+                self._hand -= 1
+            if self._hand >= len(self._ring):
+                self._hand = 0
+
+    def victim(self):
+        referenced = self._references.referenced
+        while referenced[self._ring[self._hand]]:
+            referenced[self._ring[self._hand]] = 0
+            self._hand = (self._hand + 1) % len(self._ring)
+        return self._ring[self._hand]
+
+
+## not recently used: desaloja una pagina de la clase mas baja (referenciada * 2 + modificada)
+## y despues limpia los bits de referencia (el reset periodico, aca en cada desalojo)
+class PAGE_REPLACEMENT_NRU(ABSTRACT_PAGE_REPLACEMENT):
+
+    def victim(self):
+        referenced = self._references.referenced
+        dirty = self._references.dirty
+        victim = None
+        victimClass = None
+        for frameId in self._frames:
+            pageClass = (2 if referenced[frameId] else 0) + (1 if dirty[frameId] else 0)
+            if victimClass is None or pageClass < victimClass:
+                victim = frameId
+                victimClass = pageClass
+                if pageClass == 0:
+                    break
+        for frameId in self._frames:
+            referenced[frameId] = 0
+        return victim
+
+
+## optimo de Belady: desaloja la pagina que se va a usar mas tarde (o nunca mas)
+## necesita conocer el futuro, asi que solo sirve para simulateReplacement() sobre una reference string grabada
+class PAGE_REPLACEMENT_OPT(ABSTRACT_PAGE_REPLACEMENT):
+
+    def __init__(self, references, trace):
+        super().__init__(references)
+        ## pagina -> posiciones en las que se usa
+        self._uses = dict()
+        for position, page in enumerate(trace):
+            self._uses.setdefault(page, []).append(position)
+        self._position = 0
+
+    def seek(self, position):
+        self._position = position
+
+    def nextUse(self, page):
+        uses = self._uses.get(page, [])
+        index = bisect.bisect_right(uses, self._position)
+        return uses[index] if index < len(uses) else math.inf
+
+    def victim(self):
+        return max(self._frames, key = lambda frameId: self.nextUse(self._frames[frameId]))
+
+
+PAGE_REPLACEMENTS = {
+    'FIFO': PAGE_REPLACEMENT_FIFO,
+    'LRU': PAGE_REPLACEMENT_LRU,
+    'CLOCK': PAGE_REPLACEMENT_CLOCK,
+    'NRU': PAGE_REPLACEMENT_NRU,
+    'OPT': PAGE_REPLACEMENT_OPT,
+}
+
+
+## Corre una reference string (ver Kernel(recordReferences=True)) contra frames frames libres con la
+## politica dada, sin la maquina, para comparar las politicas entre si y con el optimo
+## (la faultRate es sobre la reference string: los accesos seguidos a una misma pagina cuentan una vez)
+def simulateReplacement(trace, frames, replacement):
+    references = PageReferences(frames)
+    if replacement is PAGE_REPLACEMENT_OPT:
+        policy = replacement(references, trace)
+    else:
+        policy = replacement(references)
+    resident = dict()
+    owners = dict()
+    freeFrames = list(range(frames))
+    pageFaults = 0
+    evictions = 0
+    for position, page in enumerate(trace):
+        policy.seek(position)
+        frameId = resident.get(page)
+        if frameId is None:
+            pageFaults += 1
+            if freeFrames:
+                frameId = freeFrames.pop(0)
+            else:
+                frameId = policy.victim()
+                del resident[owners[frameId]]
+                policy.freed(frameId)
+                references.clear(frameId)
+                evictions += 1
+            resident[page] = frameId
+            owners[frameId] = page
+            policy.loaded(frameId, page)
+        references.touch(frameId, page[0], page[1])
+    return {
+        'references': len(trace),
+        'pageFaults': pageFaults,
+        'evictions': evictions,
+        'faultRate': pageFaults / len(trace) if trace else None,
+    }
+
+
+## Area de swap: guarda el contenido de las paginas modificadas que se desalojan
+class SWAP():
+    def __init__(self, kernel):
+        self.kernel = kernel
+        ## (pid, pageId) -> instrucciones de la pagina
+        self._pages = dict()
+        self._swapIns = 0
+
+    ## copia el frame al swap
+    def swapOut(self, pid, pageId, frameId):
+        frameSize = self.kernel._memoryManager.frameSize()
+        self._pages[(pid, pageId)] = self.kernel.hardware.memory.read_block(frameId * frameSize, frameSize)
+
+    def contains(self, pid, pageId):
+        return (pid, pageId) in self._pages
+
+    ## copia la pagina del swap al frame, False si la pagina no esta en el swap
+    def swapIn(self, pid, pageId, frameId):
+        page = self._pages.get((pid, pageId))
+        if page is None:
+            return False
+        frameSize = self.kernel._memoryManager.frameSize()
+        self.kernel.hardware.memory.write_block(frameId * frameSize, page)
+        self._swapIns += 1
+        return True
+
+    ## el proceso termino
+    def remove(self, pid):
+        for key in [key for key in self._pages if key[0] == pid]:
+            del self._pages[key]
+
+    @property
+    def swapIns(self):
+        return self._swapIns
+
+
+## imagePath None: los programas viven solo en memoria (se pierden al salir)
+## imagePath: archivo contenedor donde quedan guardados los programas entre corridas. Cada write
+##            agrega al final un registro [largo del path, cantidad de runs, path, los runs del programa
+##            (opcode, cantidad)]; al abrirlo solo se leen las cabeceras para armar el indice
+##            path -> cuerpo, y cada cuerpo se decodifica (desde un mmap) la primera vez que se lee
 class FILE_SYSTEM():
-    def __init__(self):
+
+    ## marca al principio del contenedor
+    MAGIC = b'SOFS\x02'
+    ## cabecera de cada registro: largo del path (en bytes), cantidad de runs
+    RECORD = struct.Struct('<HI')
+    ## cada run del cuerpo: opcode, cantidad de veces
+    RUN = struct.Struct('<BI')
+
+    def __init__(self, imagePath = None):
+        ## path -> Program (con un contenedor, solo los ya leidos o escritos en esta corrida)
         self._permanentStorage = dict()
+        ## path -> version del contenido (cambia con cada write)
+        self._versions = dict()
+        ## path -> (offset del cuerpo en el contenedor, largo del cuerpo en bytes)
+        self._index = dict()
+        self._imagePath = imagePath
+        self._file = None
+        self._image = None
+        if imagePath is not None:
+            self._file = open(imagePath, 'a+b')
+            if os.path.getsize(imagePath) == 0:
+                self._file.write(self.MAGIC)
+                self._file.flush()
+            self._image = mmap.mmap(self._file.fileno(), 0, access = mmap.ACCESS_READ)
+            if self._image[:len(self.MAGIC)] != self.MAGIC:
+                self.close()
+                raise Exception("{path} is not a FILE_SYSTEM image".format(path = imagePath))
+            self.readIndex()
+
+    ## recorre las cabeceras de los registros (sin leer los cuerpos); el ultimo registro de un path es su contenido
+    def readIndex(self):
+        offset = len(self.MAGIC)
+        size = len(self._image)
+        while offset + self.RECORD.size <= size:
+            pathLength, runs = self.RECORD.unpack_from(self._image, offset)
+            body = offset + self.RECORD.size + pathLength
+            length = runs * self.RUN.size
+            if body + length > size:
+                break
+            path = self._image[offset + self.RECORD.size:body].decode('utf-8')
+            self._index[path] = (body, length)
+            self._versions[path] = self._versions.get(path, 0) + 1
+            offset = body + length
+        if offset < size:
+            ## registro a medio escribir (se corto una corrida anterior): se descarta
+            self._image.close()
+            self._file.truncate(offset)
+            self._image = mmap.mmap(self._file.fileno(), 0, access = mmap.ACCESS_READ)
+        self._end = offset
+
+    @property
+    def imagePath(self):
+        return self._imagePath
 
     def write(self, path, program):
         self._permanentStorage[path] = program
+        self._versions[path] = self._versions.get(path, 0) + 1
+        if self._file is not None:
+            encodedPath = path.encode('utf-8')
+            body = b''.join(self.RUN.pack(OPCODES[instruction], count) for instruction, count in program.runs)
+            self._file.write(self.RECORD.pack(len(encodedPath), len(program.runs)) + encodedPath + body)
+            self._file.flush()
+            self._end += self.RECORD.size + len(encodedPath) + len(body)
+            self._index[path] = (self._end - len(body), len(body))
+
+    def version(self, path):
+        return self._versions.get(path, 0)
 
     def read(self, path):
-        return self._permanentStorage.get(path)
+        program = self._permanentStorage.get(path)
+        if program is None and path in self._index:
+            ## los escritos en esta corrida ya estan en _permanentStorage, asi que el cuerpo esta en el mmap
+            offset, length = self._index[path]
+            program = Program([InstructionRun(INSTRUCTIONS[opcode], count) for opcode, count in self.RUN.iter_unpack(self._image[offset:offset + length])])
+            self._permanentStorage[path] = program
+        return program
+
+    ## los paths guardados
+    def paths(self):
+        return list(self._versions)
+
+    def close(self):
+        if self._image is not None:
+            self._image.close()
+            self._image = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
 
 
 # emulates the core of an Operative System
+## el hardware sobre el que corre se pasa explicitamente, asi un mismo proceso
+## puede tener varias maquinas (Hardware + Kernel) independientes
 class Kernel():
 
-    def __init__(self):
+    ## scheduler: clase del scheduler a usar (SCHEDULER_FCFS, SCHEDULER_PRIORIDAD_NO_EXP,
+    ##            SCHEDULER_PRIORIDAD_EXP o SCHEDULER_RR)
+    ## frameSize: tamaño de frame con el que se bootea el MMU
+    ## demandPaging=True no carga los programas enteros: cada pagina se carga con su primer #PAGE_FAULT
+    ## pageReplacement: con demandPaging, clase de la politica que elige que pagina desalojar cuando no hay
+    ##                  frames libres (PAGE_REPLACEMENT_FIFO, _LRU, _CLOCK o _NRU), None = esperar un frame libre
+    ## recordReferences=True graba la reference string (ver simulateReplacement)
+    ## fileSystemPath: archivo contenedor del FILE_SYSTEM (los programas quedan guardados entre corridas),
+    ##                 None = los programas viven solo en memoria
+    def __init__(self, hardware = HARDWARE, scheduler = None, frameSize = 4, demandPaging = False,
+                 pageReplacement = None, recordReferences = False, fileSystemPath = None):
+        self._hardware = hardware
+        self._demandPaging = demandPaging
+        self._pageReplacement = pageReplacement
+        ## pcb (y pagina) que esperan un frame libre para seguir
+        self._frameWaitingQueue = []
+        ## pcb en "new" que esperan frames para cargar su programa (admision de largo plazo)
+        self._admissionQueue = []
+
         ## setup interruption handlers
         killHandler = KillInterruptionHandler(self)
-        HARDWARE.interruptVector.register(KILL_INTERRUPTION_TYPE, killHandler)
+        hardware.interruptVector.register(KILL_INTERRUPTION_TYPE, killHandler)
 
         ioInHandler = IoInInterruptionHandler(self)
-        HARDWARE.interruptVector.register(IO_IN_INTERRUPTION_TYPE, ioInHandler)
+        hardware.interruptVector.register(IO_IN_INTERRUPTION_TYPE, ioInHandler)
 
         ioOutHandler = IoOutInterruptionHandler(self)
-        HARDWARE.interruptVector.register(IO_OUT_INTERRUPTION_TYPE, ioOutHandler)
+        hardware.interruptVector.register(IO_OUT_INTERRUPTION_TYPE, ioOutHandler)
 
         newHandler = NewInterruptionHandler(self)
-        HARDWARE.interruptVector.register(NEW_INTERRUPTION_TYPE, newHandler)
+        hardware.interruptVector.register(NEW_INTERRUPTION_TYPE, newHandler)
 
         #Tp 4
         statHandler = StatInterruptionHandler(self)
-        HARDWARE.interruptVector.register(STAT_INTERRUPTION_TYPE, statHandler)
+        hardware.interruptVector.register(STAT_INTERRUPTION_TYPE, statHandler)
 
         timeoutHandler = TimeoutInterruptionHandler(self)
-        HARDWARE.interruptVector.register(TIMEOUT_INTERRUPTION_TYPE, timeoutHandler)
+        hardware.interruptVector.register(TIMEOUT_INTERRUPTION_TYPE, timeoutHandler)
+
+        pageFaultHandler = PageFaultInterruptionHandler(self)
+        hardware.interruptVector.register(PAGE_FAULT_INTERRUPTION_TYPE, pageFaultHandler)
 
         ## controls the Hardware's I/O Device
-        HARDWARE.cpu.enable_stats = True
-        self._ioDeviceController = IoDeviceController(HARDWARE.ioDevice)
+        hardware.cpu.enable_stats = True
+        self._ioDeviceController = IoDeviceController(hardware.ioDevice)
+
+        #Boot del S.O. : Tenemos que setearle el frameSize al MM (de cada core)
+        for core in hardware.cores:
+            core.mmu.frameSize = frameSize
 
-        #Boot del S.O. : Tenemos que setearle el frameSize al MM
-        HARDWARE.mmu.frameSize = 4
+        ## los bits de referencia y modificacion de los frames solo se llevan si se usan
+        self._pageReferences = None
+        if pageReplacement is not None or recordReferences:
+            self._pageReferences = PageReferences(hardware.memory.size // frameSize, recordReferences)
+            for core in hardware.cores:
+                core.mmu.references = self._pageReferences
 
         self._loader = LOADER(self)
-        self._pcbTable = PCB_TABLE()
-        self._dispatcher = DISPATCHER()
+        self._pcbTable = PCB_TABLE(len(hardware.cores))
+        self._dispatcher = DISPATCHER(self)
         self._diagramaDeGantt = DIAGRAMA_DE_GANTT(self._pcbTable)
-        self.fileSystem = FILE_SYSTEM()
+        self.fileSystem = FILE_SYSTEM(fileSystemPath)
         self._memoryManager = MEMORY_MANAGER(self)
+        self._swap = SWAP(self)
 
-        self._scheduler = SCHEDULER_FCFS()
-        #self._scheduler = SCHEDULER_PRIORIDAD_NO_EXP()
-        #self._scheduler = SCHEDULER_PRIORIDAD_EXP()
-        # self._scheduler = SCHEDULER_RR()
+        if scheduler is None:
+            scheduler = SCHEDULER_FCFS
+            #scheduler = SCHEDULER_PRIORIDAD_NO_EXP
+            #scheduler = SCHEDULER_PRIORIDAD_EXP
+            # scheduler = SCHEDULER_RR
+        self._scheduler = scheduler(self)
 
         #HARDWARE.cpu.enable_stats = True
 
+    @property
+    def hardware(self):
+        return self._hardware
+
     @property
     def ioDeviceController(self):
         return self._ioDeviceController
 
-    def run(self, path, priority = None):
-        parameters = {'path': path, 'priority': priority}
+    @property
+    def scheduler(self):
+        return self._scheduler
+
+    @property
+    def pcbTable(self):
+        return self._pcbTable
+
+    @property
+    def memoryManager(self):
+        return self._memoryManager
+
+    ## la reference string grabada: (pid, pageId) en el orden en que se accedieron
+    def referenceString(self):
+        return self._pageReferences.trace if self._pageReferences is not None else None
+
+    ## onFinish: funcion que se llama con el pcb cuando el proceso termina
+    ## sin paginacion bajo demanda un programa con mas paginas que frames nunca se podria cargar:
+    ## se rechaza aca, antes de levantar el #NEW
+    def run(self, path, priority = None, onFinish = None):
+        if not self.fitsInMemory(path):
+            raise Exception(self.tooBigMessage(path))
+        parameters = {'path': path, 'priority': priority, 'onFinish': onFinish}
         newIRQ = IRQ(NEW_INTERRUPTION_TYPE, parameters)
-        HARDWARE.interruptVector.handle(newIRQ)
+        self._hardware.interruptVector.handle(newIRQ)
 
         # log.logger.info("\n Executing program: {name}".format(name=path.name))
         # log.logger.info(HARDWARE)
 
+    ## Le avisa al hardware si el kernel no tiene nada que hacer: ningun pcb corriendo,
+    ## la readyQueue vacia, ningun pcb usando o esperando el dispositivo y ninguno esperando frames
+    ## Si lo unico que queda son pcb esperando un frame libre, ninguno va a poder liberar los suyos:
+    ## sin politica de reemplazo (pageReplacement) es un deadlock y se avisa en vez de quedarse esperando
+    def checkIdle(self):
+        stalled = self._pcbTable.noneRunning() and not self._scheduler.NotIsEmpty() and self._ioDeviceController.isIdle()
+        if stalled and self._frameWaitingQueue:
+            pids = [pair['pcb'].getPid() for pair in self._frameWaitingQueue]
+            raise Exception("Deadlock: los pcb {pids} esperan un frame libre y no hay ningun otro proceso que los libere".format(pids = pids))
+        idle = stalled and not self._admissionQueue
+        self._hardware.clock.setIdle(idle)
+
+    ## version asyncio de run: retorna un Future que se resuelve con el pcb cuando termina
+    ## (el clock lo tiene que estar corriendo hardware.run_until_idle() en el mismo event loop)
+    ##   pcb = await kernel.run_async('c:/prg1.exe', 1)
+    def run_async(self, path, priority = None):
+        finished = asyncio.get_running_loop().create_future()
+        ## si el que espera cancelo el Future (por ejemplo con asyncio.wait_for) ya no hay a quien avisarle
+        def onFinish(pcb):
+            if not finished.done():
+                finished.set_result(pcb)
+        self.run(path, priority, onFinish)
+        return finished
+
+    ## programa el arribo de un path para el tick dado
+    ## (el arribo corre dentro del clock: si el programa no entra en memoria se rechaza con un error en el log)
+    def runAt(self, tickNbr, path, priority = None):
+        self._hardware.clock.schedule(tickNbr, lambda: self.arrive(path, priority))
+
+    def arrive(self, path, priority):
+        if self.fitsInMemory(path):
+            self.run(path, priority)
+        else:
+            log.logger.error(self.tooBigMessage(path))
+
+    ## sin paginacion bajo demanda el programa tiene que entrar entero en la memoria
+    def fitsInMemory(self, path):
+        return self._demandPaging or self.pageCount(path) <= self._memoryManager.frameCount()
+
+    def pageCount(self, path):
+        return self.fileSystem.read(path).pageCount(self._memoryManager.frameSize())
+
+    def tooBigMessage(self, path):
+        return "El programa {path} ({pages} paginas) no entra en memoria".format(path = path, pages = self.pageCount(path))
+
 
     def __repr__(self):
         return "Kernel"
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+
+## Barrido de parametros: corre cada combinacion de
+## (scheduler, quantum, frameSize, memorySize, workload) en una maquina headless
+## y junta las metricas de todas las corridas en una tabla CSV o JSON.
+##
+##   python sweep.py --schedulers FCFS,RR --quantums 2,4 --frameSizes 4,8 --memorySizes 32,64 --out resultados.csv
+
+import argparse
+import contextlib
+import csv
+import io
+import itertools
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from hardware import *
+from so import *
+import log
+
+
+SCHEDULERS = {
+    'FCFS': SCHEDULER_FCFS,
+    'PRIORIDAD_NO_EXP': SCHEDULER_PRIORIDAD_NO_EXP,
+    'PRIORIDAD_EXP': SCHEDULER_PRIORIDAD_EXP,
+    'RR': SCHEDULER_RR,
+}
+
+## Cada workload es una lista de (prioridad, tick de arribo, programa)
+## en el programa un numero n es ASM.CPU(n) y 'IO' es ASM.IO()
+WORKLOADS = {
+    'main': [
+        (1, 0, [2, 'IO', 3, 'IO', 2]),
+        (3, 0, [2]),
+        (2, 0, [4, 'IO', 1]),
+    ],
+    'cpu_bound': [
+        (1, 0, [20]),
+        (2, 2, [12, 'IO', 8]),
+        (3, 4, [30]),
+        (2, 6, [5, 'IO', 15]),
+    ],
+    'io_bound': [
+        (2, 0, [1, 'IO', 1, 'IO', 1, 'IO', 1]),
+        (1, 1, ['IO', 2, 'IO', 2, 'IO']),
+        (3, 3, [3, 'IO', 'IO', 3]),
+        (2, 5, [1, 'IO', 1, 'IO']),
+    ],
+}
+
+FIELDS = ['scheduler', 'quantum', 'frameSize', 'memorySize', 'workload',
+          'processes', 'ticks', 'avgTurnaround', 'avgWaiting', 'throughput', 'wallSeconds', 'error']
+
+
+def buildProgram(spec):
+    instructions = []
+    for instr in spec:
+        if instr == 'IO':
+            instructions.append(ASM.IO())
+        else:
+            instructions.append(ASM.CPU(instr))
+    return Program(instructions)
+
+
+## corre una celda del barrido y devuelve una fila con sus metricas
+def runCell(cell, maxTicks = 100000):
+    schedulerName, quantum, frameSize, memorySize, workloadName = cell
+    row = {'scheduler': schedulerName, 'quantum': quantum, 'frameSize': frameSize,
+           'memorySize': memorySize, 'workload': workloadName, 'error': ''}
+    workload = WORKLOADS[workloadName]
+    start = time.perf_counter()
+    try:
+        ## los handlers todavia imprimen mensajes de debug por stdout
+        with contextlib.redirect_stdout(io.StringIO()):
+            hardware = Hardware()
+            hardware.setup(memorySize, burstMode = True)
+            kernel = Kernel(hardware, SCHEDULERS[schedulerName], frameSize)
+            if quantum is not None:
+                kernel.scheduler.setearTimer(quantum)
+            for index, (priority, arrival, spec) in enumerate(workload):
+                path = 'c:/prg{index}.exe'.format(index = index)
+                kernel.fileSystem.write(path, buildProgram(spec))
+                if arrival == 0:
+                    kernel.run(path, priority)
+                else:
+                    kernel.runAt(arrival, path, priority)
+            while kernel.pcbTable.terminatedCount() < len(workload):
+                if hardware.clock.currentTick >= maxTicks:
+                    raise Exception("no termino en {maxTicks} ticks".format(maxTicks = maxTicks))
+                hardware.step()
+        pcbs = kernel.pcbTable.getAll()
+        row['processes'] = len(pcbs)
+        row['ticks'] = max(pcb.getFinishTick() for pcb in pcbs) + 1
+        row['avgTurnaround'] = sum(pcb.getTurnaround() for pcb in pcbs) / len(pcbs)
+        row['avgWaiting'] = sum(pcb.getWaitingTicks() for pcb in pcbs) / len(pcbs)
+        row['throughput'] = len(pcbs) / row['ticks']
+    except Exception as e:
+        row['error'] = "{type}: {msg}".format(type = type(e).__name__, msg = e)
+    row['wallSeconds'] = time.perf_counter() - start
+    return row
+
+
+## todas las combinaciones, el quantum solo tiene sentido para RR
+def buildGrid(schedulers, quantums, frameSizes, memorySizes, workloads):
+    grid = []
+    for schedulerName, frameSize, memorySize, workloadName in itertools.product(schedulers, frameSizes, memorySizes, workloads):
+        cellQuantums = quantums if schedulerName == 'RR' else [None]
+        for quantum in cellQuantums:
+            grid.append((schedulerName, quantum, frameSize, memorySize, workloadName))
+    return grid
+
+
+def runSweep(grid, workers = None):
+    with ProcessPoolExecutor(max_workers = workers or os.cpu_count()) as executor:
+        return list(executor.map(runCell, grid, chunksize = max(1, len(grid) // (4 * (workers or os.cpu_count())))))
+
+
+def writeResults(rows, out):
+    if out.endswith('.json'):
+        with open(out, 'w') as f:
+            json.dump(rows, f, indent = 2)
+    else:
+        with open(out, 'w', newline = '') as f:
+            writer = csv.DictWriter(f, fieldnames = FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+def intList(text):
+    return [int(value) for value in text.split(',')]
+
+
+##
+##  MAIN
+##
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Barrido de schedulers, frames y memorias')
+    parser.add_argument('--schedulers', default = ','.join(SCHEDULERS))
+    parser.add_argument('--quantums', type = intList, default = [3])
+    parser.add_argument('--frameSizes', type = intList, default = [4])
+    parser.add_argument('--memorySizes', type = intList, default = [32])
+    parser.add_argument('--workloads', default = ','.join(WORKLOADS))
+    parser.add_argument('--workers', type = int, default = None)
+    parser.add_argument('--out', default = 'sweep.csv', help = 'archivo .csv o .json')
+    args = parser.parse_args()
+
+    log.setupLogger()
+    log.logger.setLevel(logging.WARNING)
+
+    grid = buildGrid(args.schedulers.split(','), args.quantums, args.frameSizes, args.memorySizes, args.workloads.split(','))
+    rows = runSweep(grid, args.workers)
+    writeResults(rows, args.out)
+    log.logger.warning("{cells} corridas guardadas en {out}".format(cells = len(rows), out = args.out))